@@ -7,45 +7,173 @@ import libs.uid_gen as uid_gen
 import json  
 
 import libs.certGen as cert_gen
+import libs.cardGen as card_gen
 import os
 
 # Import admin functions from adminPanel.py
 from libs.adminPanel import AdminPanel
+from libs.maintenance import CompactionJob
+from libs.config import load_config
+from libs.db_executor import DBWriter, WriteTimeoutError
+from libs.sharded_repository import open_repository
+from libs.repository import ActionPendingError, DEBITED, REFUNDED
+from libs.rate_limit import RateLimiter, SingleFlight
+import uuid
+import hashlib
 
 SECRETCODE = os.environ.get("SECRET_CODE")
+TRANSACTIONS_PAGE_SIZE = 20
+CONFLICT_RETRIES = 3
+# How long a submitted action's result is kept to answer repeated submissions
+IDEMPOTENCY_TTL = 24 * 60 * 60
 
 def generate_certificate(user_name, uid, num_shares, certificate_type):
-    if certificate_type == "A4 Sized Certificate (₹80)":
-        template_path = os.path.join("assets", "template.docx")
-        output_dir = os.path.join("assets", "certs")
-        
-        # Get date in words
-        current_date = datetime.now().strftime("%d %B %Y")
-        
-        # Calculate total percentage based on number of shares
-        total_percentage = f"{0.5 * num_shares}%"
-        
-        details = {
-            "{name}": user_name,
-            "{date}": current_date,
-            "{percentage}": total_percentage,
-            "{uid}": uid
-        }
-        
-        try:
-            output_path = cert_gen.generate_docx_with_shapes(template_path, output_dir, details)
-            return True
-        except Exception as e:
-            st.error(f"Error generating certificate: {e}")
-            return False
-    return False
-
-# Initialize database and UID generator
-db_wrapper = db_con.DBWrapper()
-uid_generator = uid_gen.UIDGen(db_wrapper)
+    if certificate_type not in ("A4 Sized Certificate (₹80)", "Small Card (₹40)"):
+        return False
+
+    # Get date in words
+    current_date = datetime.now().strftime("%d %B %Y")
+
+    # Calculate total percentage based on number of shares
+    total_percentage = f"{0.5 * num_shares}%"
+
+    details = {
+        "{name}": user_name,
+        "{date}": current_date,
+        "{percentage}": total_percentage,
+        "{uid}": uid
+    }
+
+    try:
+        if certificate_type == "A4 Sized Certificate (₹80)":
+            template_path = os.path.join("assets", "template.docx")
+            output_dir = os.path.join("assets", "certs")
+            cert_gen.generate_docx_with_shapes(template_path, output_dir, details)
+        else:
+            card_config = load_config().get('cards', {})
+            card_gen.generate_card(
+                os.path.join("assets", "certs", "cards"), details,
+                formats=tuple(card_config.get('formats', card_gen.FORMATS)),
+                font_path=card_config.get('font_path')
+            )
+        return True
+    except Exception as e:
+        st.error(f"Error generating certificate: {e}")
+        return False
+
+# Initialize database and UID generator once per server process so the
+# connection, user cache and UID set survive reruns and are shared by sessions
+@st.cache_resource
+def get_db_wrapper():
+    # The single db/users.db, or a ShardedRepository when database.shards > 1
+    return open_repository()
+
+@st.cache_resource
+def get_db_writer():
+    # All page handlers queue their writes on this one thread
+    return DBWriter(timeout=load_config().get('database', {}).get('write_timeout', 10))
+
+@st.cache_resource
+def get_uid_generator():
+    return uid_gen.UIDGen(get_db_wrapper())
+
+db_wrapper = get_db_wrapper()
+db_writer = get_db_writer()
+uid_generator = get_uid_generator()
 
 # Initialize AdminPanel object
-admin_panel = AdminPanel()
+admin_panel = AdminPanel(db_wrapper, db_writer)
+
+@st.cache_resource
+def get_lookup_guards():
+    # Shared by all sessions: per-session and per-client limits, a per-UID
+    # limit on audit writes (throttled lookups are counted in the next entry),
+    # and coalescing of identical in-flight lookups
+    config = load_config().get('rate_limit', {})
+    session_config = config.get('session', {})
+    client_config = config.get('client', {})
+    return {
+        'session': RateLimiter(session_config.get('capacity', 10), session_config.get('refill_rate', 0.5)),
+        'client': RateLimiter(client_config.get('capacity', 30), client_config.get('refill_rate', 2)),
+        'audit': RateLimiter(1, 1 / config.get('audit_interval', 60)),
+        'flight': SingleFlight(),
+    }
+
+lookup_guards = get_lookup_guards()
+
+def client_key():
+    # Best-effort client address; falls back to a shared bucket when unknown
+    ip_address = getattr(st.context, 'ip_address', None)
+    if not ip_address:
+        forwarded = st.context.headers.get('X-Forwarded-For', '')
+        ip_address = forwarded.split(',')[0].strip()
+    return ip_address or 'unknown'
+
+def lookup_allowed():
+    if 'rate_limit_id' not in st.session_state:
+        st.session_state.rate_limit_id = uuid.uuid4().hex
+    if (lookup_guards['session'].allow(st.session_state.rate_limit_id)
+            and lookup_guards['client'].allow(client_key())):
+        return True
+    st.error("Too many lookups. Please wait a moment and try again.")
+    return False
+
+def verify_lookup(uid, details, cached=True):
+    """
+    Look up a user and log the verification, sharing the work with identical
+    concurrent lookups. Pass cached=False when the user will be the base of a write.
+    """
+    def lookup():
+        user = db_wrapper.get_user_by_uid(uid, cached)
+        if user:
+            allowed, skipped = lookup_guards['audit'].acquire(uid)
+            if allowed:
+                # Lookups throttled since the last entry are counted in this one
+                entry = f"{details} (+{skipped} more since the last entry)" if skipped else details
+                # Nobody needs to wait for the audit entry
+                db_writer.post(db_wrapper.add_transaction, uid, "verification", 0, entry)
+        return user
+    return lookup_guards['flight'].do((uid, cached), lookup)
+
+def run_once(key_name, action, args, fn):
+    """
+    Run a write action at most once per form submission.
+
+    The idempotency key combines a token kept in session state under
+    `key_name` with the action and its arguments. Reruns with the same inputs
+    (a double click, a retry after a timeout) get the stored result back;
+    changing an input makes it a new action. The check and the action run
+    together on the writer thread, so a repeat queued behind the original
+    still sees its result.
+
+    Args:
+        key_name (str): Session state key of the form's token.
+        action (str): Name of the action.
+        args (dict): The inputs the action writes, JSON-serializable.
+        fn (callable): Performs the action.
+
+    Returns:
+        tuple: (result, replayed)
+    """
+    if key_name not in st.session_state:
+        st.session_state[key_name] = uuid.uuid4().hex
+    payload = json.dumps([action, args], sort_keys=True)
+    key = hashlib.sha256(f"{st.session_state[key_name]}:{payload}".encode()).hexdigest()
+    return db_writer.call(db_wrapper.run_idempotent, key, action, fn, IDEMPOTENCY_TTL)
+
+def submission_done(key_name):
+    # The next submission of this form is a new action with a new key
+    st.session_state.pop(key_name, None)
+
+@st.cache_resource
+def start_compaction_job():
+    # One background job per server process; its writes queue on the shared
+    # writer thread like the pages' do
+    job = CompactionJob.from_config(db_wrapper, writer=db_writer)
+    job.start()
+    return job
+
+start_compaction_job()
 
 def main():
     # Set page configuration
@@ -176,11 +304,12 @@ def new_user_investment():
 
         # Calculate number of shares and resale value
         num_shares = st.session_state['investment'] // 500
-        resale_value = 480 * num_shares
+        price_schedule = db_wrapper.pricing.current()
+        resale_value = price_schedule.resale_value(st.session_state['investment'])
 
         st.write(f"Amount to Invest: ₹{st.session_state['investment']}")
         st.write(f"Number of Profit Shares*: {num_shares}")
-        st.write(f"Live Resale Value: ₹{resale_value} (₹480 per ₹500 profit share*)")
+        st.write(f"Live Resale Value: ₹{resale_value} (₹{price_schedule.resale_value_per_share} per ₹500 profit share*)")
 
         # Certificate type selection
         certificate_type = st.selectbox("Choose Certificate Type:", ["Small Card (₹40)", "A4 Sized Certificate (₹80)"], key="new_cert_type")
@@ -213,30 +342,45 @@ def new_user_investment():
             elif not agree_tnc or not agree_non_refund:
                 st.error("Please agree to the terms and conditions.")
             else:
-                # Generate UID
-                uid = uid_generator.generate_uid()
-
                 # Save data to the database
                 date_of_investment = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 amount_invested = st.session_state['investment']
                 email = None  # Optional, not collected here
 
-                # Add user to the database
-                try:
+                def register():
+                    # Generate UID
+                    uid = uid_generator.generate_uid()
                     db_wrapper.add_user(uid, full_name, phone_number, amount_invested, date_of_investment, email, resale_value)
                     db_wrapper.update_certificate_type(uid, certificate_type)
                     # Log transaction
                     db_wrapper.add_transaction(uid, "investment", amount_invested, "Initial investment")
+                    return {'uid': uid}
+
+                # Add user to the database
+                try:
+                    result, replayed = run_once('register_key', 'register', {
+                        'name': full_name, 'phone': phone_number,
+                        'amount': int(amount_invested), 'certificate_type': certificate_type,
+                    }, register)
+                    uid = result['uid']
                     st.success("Account created successfully!")
                     st.write(f"Your UID is: `{uid}`")
                     st.write("Please note that your certificate of ownership will reach you in 10 days to a month.")
                     st.write(f"Total Payable Amount (including certificate cost): ₹{total_payable}")
                     st.write("Wait 4-8 hours for the UID to reflect on the verification page.")
-                    # Generate certificate if selected
-                    if certificate_type == "A4 Sized Certificate (₹80)":
+                    # Generate certificate if selected, once per registration
+                    if not replayed:
                         generate_certificate(full_name, uid, num_shares, certificate_type)
                     # Reset session state
                     st.session_state['investment'] = 0
+                    submission_done('register_key')
+                except WriteTimeoutError as e:
+                    st.warning(f"{e} Press Proceed again to see your UID; you won't be registered twice.")
+                except ActionPendingError:
+                    # An earlier attempt may have registered; a new submission starts fresh
+                    submission_done('register_key')
+                    st.warning("An earlier attempt was interrupted and may have completed. "
+                               "Please contact us with your phone number before registering again.")
                 except Exception as e:
                     st.error(f"An error occurred: {e}")
 
@@ -250,23 +394,23 @@ def existing_user_management():
     # UID input and verification without secret code
     if not st.session_state.uid_verified:
         uid = st.text_input("Enter your UID:", key="existing_uid")
-        if st.button("Verify UID", key="verify_uid"):
-            user = db_wrapper.get_user_by_uid(uid)
+        if st.button("Verify UID", key="verify_uid") and lookup_allowed():
+            # Also logs the verification as a transaction. Reinvestments and
+            # transfers are based on this read, so it skips the cache.
+            user = verify_lookup(uid, "User checked account details", cached=False)
             if user:
                 st.success("UID verified!")
                 st.session_state.uid_verified = True
                 st.session_state.uid = uid
                 st.session_state.user_data = user
-                # Log verification as a transaction
-                db_wrapper.add_transaction(uid, "verification", 0, "User checked account details")
                 st.rerun()
             else:
                 st.error("UID not found. Please check and try again.")
     else:
         user = st.session_state.user_data
-        st.write(f"**Name:** {user[1]}")
-        st.write(f"**Current Investment:** ₹{user[4]}")
-        st.write(f"**Current Resale Value:** ₹{user[6]}")
+        st.write(f"**Name:** {user.name}")
+        st.write(f"**Current Investment:** ₹{user.amount_invested}")
+        st.write(f"**Current Resale Value:** ₹{user.resale_value}")
 
         # Action Selection
         action = st.radio("Select Action:", ["Reinvest", "Transfer Investment"], key="existing_action")
@@ -286,9 +430,9 @@ def existing_user_management():
 def reinvestment(uid, user):
     st.subheader("Reinvestment")
 
-    st.write(f"**Name:** {user[1]}")
-    st.write(f"**Current Investment:** ₹{user[4]}")
-    st.write(f"**Current Resale Value:** ₹{user[6]}")
+    st.write(f"**Name:** {user.name}")
+    st.write(f"**Current Investment:** ₹{user.amount_invested}")
+    st.write(f"**Current Resale Value:** ₹{user.resale_value}")
 
     if 'additional_investment' not in st.session_state:
         st.session_state.additional_investment = 0
@@ -298,12 +442,11 @@ def reinvestment(uid, user):
 
     additional_investment = st.session_state.additional_investment
     if additional_investment > 0:
-        new_total_investment = user[4] + additional_investment
-        num_shares = new_total_investment // 500
-        new_resale_value = 480 * num_shares
+        new_total_investment = user.amount_invested + additional_investment
+        new_resale_value = db_wrapper.pricing.resale_value(new_total_investment)
 
         st.markdown("### Investment Summary:")
-        st.write(f"**Current Investment:** ₹{user[4]}")
+        st.write(f"**Current Investment:** ₹{user.amount_invested}")
         st.write(f"**Additional Investment:** ₹{additional_investment}")
         st.write(f"**New Total Investment:** ₹{new_total_investment}")
         st.write(f"**New Resale Value:** ₹{new_resale_value}")
@@ -328,25 +471,51 @@ def reinvestment(uid, user):
                 st.error("Invalid secret code.")
                 return
                 
+            def reinvest():
+                # Add the amount to the latest balance and log it. The amount doesn't
+                # depend on the balance, so a conflict is retried on a fresh row.
+                current = user
+                for attempt in range(CONFLICT_RETRIES):
+                    try:
+                        db_wrapper.change_investment(uid, additional_investment, current.version,
+                                                     "reinvestment", "Added additional investment")
+                        return {'amount': additional_investment}
+                    except db_con.ConcurrencyError:
+                        if attempt == CONFLICT_RETRIES - 1:
+                            raise
+                        current = db_wrapper.get_user_by_uid(uid, cached=False)
+                        if current is None:
+                            # Deleted in the meantime, e.g. by an admin
+                            raise ValueError("Your account no longer exists.")
+
             try:
-                # Update user investment and resale value
-                db_wrapper.update_investment(uid, new_total_investment, new_resale_value)
-                # Log transaction
-                db_wrapper.add_transaction(uid, "reinvestment", additional_investment, "Added additional investment")
+                _, replayed = run_once('reinvest_key', 'reinvestment', {'uid': uid, 'amount': int(additional_investment)}, reinvest)
+                submission_done('reinvest_key')
                 st.success("Reinvestment successful!")
 
-                # Generate certificate if selected and A4 option
-                if certificate_type == "A4 Sized Certificate (₹80)":
-                    if generate_certificate(user[1], uid, num_shares, certificate_type):
+                # Update user data
+                st.session_state.user_data = db_wrapper.get_user_by_uid(uid, cached=False)
+                num_shares = st.session_state.user_data.amount_invested // 500
+
+                # Generate certificate if selected, once per reinvestment
+                if not replayed and certificate_type == "A4 Sized Certificate (₹80)":
+                    if generate_certificate(user.name, uid, num_shares, certificate_type):
                         st.success("A4 Sized Certificate will be sent to you within 10 days.")
-                elif certificate_type == "Small Card (₹40)":
-                    st.info("Small Card Certificate option selected. Please request if needed.")
+                elif not replayed and certificate_type == "Small Card (₹40)":
+                    if generate_certificate(user.name, uid, num_shares, certificate_type):
+                        st.success("Small Card Certificate will be sent to you within 10 days.")
 
                 # Reset additional investment
                 st.session_state.additional_investment = 0
-                # Update user data
-                st.session_state.user_data = db_wrapper.get_user_by_uid(uid)
                 st.rerun()
+            except db_con.ConcurrencyError:
+                st.error("Your account is being updated elsewhere. Please try again.")
+            except WriteTimeoutError as e:
+                st.warning(f"{e} Confirm again to see the result; with the same details it won't be applied twice.")
+            except ActionPendingError:
+                submission_done('reinvest_key')
+                st.warning("An earlier attempt was interrupted and may have completed. "
+                           "Check your transaction history before confirming again.")
             except Exception as e:
                 st.error(f"An error occurred: {e}")
     else:
@@ -369,15 +538,15 @@ def transfer_investment(uid, user):
         st.session_state.transfer_amount = 500
         
     # Display sender info
-    st.write(f"**Your Name:** {user[1]}")
-    st.write(f"**Your Current Investment:** ₹{user[4]}")
-    st.write(f"**Your Current Resale Value:** ₹{user[6]}")
+    st.write(f"**Your Name:** {user.name}")
+    st.write(f"**Your Current Investment:** ₹{user.amount_invested}")
+    st.write(f"**Your Current Resale Value:** ₹{user.resale_value}")
 
     # Step 1: Get and verify recipient UID
     if st.session_state.transfer_step == 1:
         target_uid = st.text_input("Enter recipient's UID:", key="transfer_target_uid")
         if st.button("Verify Recipient"):
-            target_user = db_wrapper.get_user_by_uid(target_uid)
+            target_user = db_wrapper.get_user_by_uid(target_uid, cached=False)
             if target_user and target_uid != uid:  # Prevent self-transfer
                 st.session_state.target_user = target_user
                 st.session_state.target_uid = target_uid
@@ -392,13 +561,13 @@ def transfer_investment(uid, user):
     elif st.session_state.transfer_step == 2:
         st.success("Recipient Verified!")
         target_user = st.session_state.target_user
-        st.write(f"**Recipient Name:** {target_user[1]}")
-        st.write(f"**Recipient Current Investment:** ₹{target_user[4]}")
+        st.write(f"**Recipient Name:** {target_user.name}")
+        st.write(f"**Recipient Current Investment:** ₹{target_user.amount_invested}")
         
         transfer_amount = st.number_input(
             "Amount to transfer (in multiples of ₹500):",
             min_value=500,
-            max_value=user[4],
+            max_value=user.amount_invested,
             step=500,
             value=st.session_state.transfer_amount
         )
@@ -424,42 +593,37 @@ def transfer_investment(uid, user):
         if st.button("Confirm Transfer"):
             if secret_code != SECRETCODE:
                 st.error("Invalid secret code.")
-            elif transfer_amount > user[4]:
+            elif transfer_amount > user.amount_invested:
                 st.error("Transfer amount exceeds your current investment.")
             elif transfer_amount % 500 != 0:
                 st.error("Transfer amount must be in multiples of ₹500.")
             else:
+                target_uid = st.session_state.target_uid
+
+                def transfer():
+                    # Move the amount and log both sides, provided the sender's
+                    # balance is still the one shown here
+                    outcome = db_wrapper.transfer(uid, target_uid, transfer_amount, user.version)
+                    return {'recipient': target_uid, 'amount': transfer_amount, 'outcome': outcome}
+
                 try:
-                    # Calculate new values
-                    sender_new_investment = user[4] - transfer_amount
-                    sender_new_resale = 480 * (sender_new_investment // 500)
-                    
-                    recipient_new_investment = target_user[4] + transfer_amount
-                    recipient_new_resale = 480 * (recipient_new_investment // 500)
-
-                    # Update database
-                    db_wrapper.update_investment(uid, sender_new_investment, sender_new_resale)
-                    db_wrapper.update_investment(st.session_state.target_uid, 
-                                              recipient_new_investment, 
-                                              recipient_new_resale)
-
-                    # Log transactions
-                    db_wrapper.add_transaction(uid, "transfer_out", 
-                                            -transfer_amount,
-                                            f"Transferred to UID {st.session_state.target_uid}")
-                    db_wrapper.add_transaction(st.session_state.target_uid, 
-                                            "transfer_in",
-                                            transfer_amount,
-                                            f"Received from UID {uid}")
-
-                    # Generate certificate if selected
-                    if certificate_type == "A4 Sized Certificate (₹80)":
-                        if generate_certificate(target_user[1], st.session_state.target_uid, 
-                                             transfer_amount // 500, certificate_type):
+                    result, replayed = run_once('transfer_key', 'transfer',
+                                                {'uid': uid, 'recipient': target_uid, 'amount': int(transfer_amount)}, transfer)
+                    submission_done('transfer_key')
+
+                    if result.get('outcome') == REFUNDED:
+                        # The recipient's account was deleted mid-transfer; nothing was moved
+                        st.warning("The recipient's account no longer exists. The amount was returned to your investment.")
+                    else:
+                        # Generate certificate if selected
+                        if not replayed and generate_certificate(target_user.name, target_uid,
+                                                                 transfer_amount // 500, certificate_type):
                             st.success("Certificate will be generated for the recipient.")
 
-                    # Success message
-                    st.success("Transfer completed successfully!")
+                        if result.get('outcome') == DEBITED:
+                            st.success("Transfer accepted. The recipient's balance will be updated shortly.")
+                        else:
+                            st.success("Transfer completed successfully!")
                     
                     # Reset transfer state
                     st.session_state.transfer_step = 1
@@ -467,9 +631,21 @@ def transfer_investment(uid, user):
                     st.session_state.transfer_amount = 500
                     
                     # Update user data
-                    st.session_state.user_data = db_wrapper.get_user_by_uid(uid)
-                    st.rerun()
-
+                    st.session_state.user_data = db_wrapper.get_user_by_uid(uid, cached=False)
+                    # A rerun would clear the refund warning before it is read
+                    if result.get('outcome') != REFUNDED:
+                        st.rerun()
+
+                except db_con.ConcurrencyError:
+                    # The transfer amount was chosen against a stale balance, so ask again
+                    st.session_state.user_data = db_wrapper.get_user_by_uid(uid, cached=False)
+                    st.error("Your balance changed since you verified. Please review it and confirm the transfer again.")
+                except WriteTimeoutError as e:
+                    st.warning(f"{e} Confirm again to see the result; with the same details it won't be applied twice.")
+                except ActionPendingError:
+                    submission_done('transfer_key')
+                    st.warning("An earlier attempt was interrupted and may have completed. "
+                               "Check your transaction history before confirming again.")
                 except Exception as e:
                     st.error(f"Transfer failed: {str(e)}")
 
@@ -486,37 +662,76 @@ def verify_uid():
     # Back button
     if st.button("Back"):
         st.session_state['current_page'] = 'home'
+        st.session_state.verified_user = None
         st.rerun()
 
     uid = st.text_input("Enter your UID:", key="verify_uid_input")
 
-    if st.button("Verify UID", key="verify_uid_button"):
-        user = db_wrapper.get_user_by_uid(uid)
-        if user:
-            # Display user information
-            st.success("UID found!")
-            st.write(f"**UID:** {user[0]}")
-            st.write(f"**Name:** {user[1]}")
-            st.write(f"**Amount Invested:** ₹{user[4]}")
-            st.write(f"**Date of Investment:** {user[5]}")
-            st.write(f"**Resale Value:** ₹{user[6]}")
-            st.write(f"**Certificate Type:** {user[7]}")
-
-            # Display transaction history
-            transactions = db_wrapper.get_transactions(uid)
-            if transactions:
-                st.markdown("### Transaction History:")
-                for txn in transactions:
-                    st.write(f"**{txn['timestamp']}** - {txn['type'].capitalize()}: {txn['details']} (₹{txn['amount']})")
-            else:
-                st.write("No transactions found.")
-
-            # Log verification as a transaction
-            db_wrapper.add_transaction(uid, "verification", 0, "User verification")
-        else:
+    if st.button("Verify UID", key="verify_uid_button") and lookup_allowed():
+        # Also logs the verification as a transaction
+        user = verify_lookup(uid, "User verification")
+        st.session_state.verified_user = user
+        if not user:
             st.error("UID not found. Please check and try again.")
 
+    # Keep showing the verified user across reruns so the history can be paged
+    user = st.session_state.get('verified_user')
+    if user and user.uid == uid:
+        # Display user information
+        st.success("UID found!")
+        st.write(f"**UID:** {user.uid}")
+        st.write(f"**Name:** {user.name}")
+        st.write(f"**Amount Invested:** ₹{user.amount_invested}")
+        st.write(f"**Date of Investment:** {user.date_of_investment}")
+        st.write(f"**Resale Value:** ₹{user.resale_value}")
+        st.write(f"**Certificate Type:** {user.certificate_type}")
+
+        transaction_history(uid)
+
+def transaction_history(uid):
+    st.markdown("### Transaction History:")
+
+    txn_type = st.selectbox(
+        "Filter by type:",
+        ["All"] + db_wrapper.get_transaction_types(uid),
+        key="verify_txn_type",
+        format_func=lambda t: t.replace('_', ' ').capitalize()
+    )
+
+    # Stack of page cursors; the last one is the page being shown
+    if st.session_state.get('verify_txn_filter') != (uid, txn_type):
+        st.session_state.verify_txn_filter = (uid, txn_type)
+        st.session_state.verify_txn_cursors = [None]
+    cursors = st.session_state.verify_txn_cursors
+
+    transactions, next_cursor = db_wrapper.get_transactions_page(
+        uid, TRANSACTIONS_PAGE_SIZE, cursors[-1], None if txn_type == "All" else txn_type
+    )
+    if not transactions:
+        st.write("No transactions found.")
+        return
+
+    st.dataframe(
+        [{
+            "Date": txn.timestamp,
+            "Type": txn.type.replace('_', ' ').capitalize(),
+            "Details": txn.details,
+            "Amount (₹)": txn.amount,
+        } for txn in transactions],
+        hide_index=True,
+        use_container_width=True
+    )
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if len(cursors) > 1 and st.button("← Newer", key="verify_txn_newer"):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if next_cursor and st.button("Older →", key="verify_txn_older"):
+            cursors.append(next_cursor)
+            st.rerun()
+
 if __name__ == "__main__":
     main()
-    db_wrapper.close()
     # Coded with ❤️ by a3ro-dev
\ No newline at end of file
@@ -0,0 +1,59 @@
+# bench_cards.py
+"""
+Benchmarks Small Card rendering.
+
+Renders the same batch of cards one by one in this process and then over a
+process pool (libs.cardGen.generate_cards), into a scratch directory, and
+reports cards per second for each.
+
+Usage:
+    python bench/bench_cards.py --cards 200 --processes 4
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import libs.cardGen as card_gen  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=200)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--formats", default="png,pdf")
+    args = parser.parse_args()
+    formats = tuple(args.formats.split(","))
+
+    details_list = [
+        {"{name}": f"Investor {i}", "{date}": "01 January 2025", "{percentage}": f"{0.5 * (i % 20 + 1)}%",
+         "{uid}": f"UID{i:06d}"}
+        for i in range(args.cards)
+    ]
+
+    workdir = tempfile.mkdtemp(prefix="bench_cards_")
+    try:
+        started = time.perf_counter()
+        card_gen.card_background()
+        print(f"Background render (once per process): {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        started = time.perf_counter()
+        for details in details_list:
+            card_gen.generate_card(os.path.join(workdir, "serial"), details, formats)
+        seconds = time.perf_counter() - started
+        print(f"Serial:                {args.cards / seconds:8.1f} cards/s")
+
+        started = time.perf_counter()
+        card_gen.generate_cards(os.path.join(workdir, "pool"), details_list, formats, processes=args.processes)
+        seconds = time.perf_counter() - started
+        print(f"Pool ({args.processes} processes):  {args.cards / seconds:8.1f} cards/s")
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
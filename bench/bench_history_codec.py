@@ -0,0 +1,78 @@
+# bench_history_codec.py
+"""
+Compares the JSON and binary encodings of history payloads.
+
+Builds synthetic per-user histories shaped like the app's (mostly
+verification entries, some investments and transfers), encodes each one
+both ways and reports payload size and encode/decode time.
+
+Usage:
+    python bench/bench_history_codec.py --users 2000 --entries 200
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import libs.history_codec as history_codec  # noqa: E402
+
+ENTRY_TYPES = [
+    ("verification", 0, "User verification"),
+    ("verification", 0, "User checked account details"),
+    ("reinvestment", 500, "Added additional investment"),
+    ("transfer_out", -500, "Transferred to UID aB3x1234"),
+    ("transfer_in", 1000, "Received from UID Zq9!5678"),
+]
+
+def make_history(rng, entries):
+    moment = datetime(2024, 1, 1) + timedelta(seconds=rng.randrange(10 ** 6))
+    history = [{'timestamp': moment.isoformat(), 'type': 'investment', 'amount': 500, 'details': 'Initial investment'}]
+    for _ in range(entries - 1):
+        moment += timedelta(seconds=rng.randrange(1, 86400), microseconds=rng.randrange(10 ** 6))
+        transaction_type, amount, details = rng.choices(ENTRY_TYPES, weights=[6, 2, 1, 1, 1])[0]
+        history.append({'timestamp': moment.isoformat(), 'type': transaction_type, 'amount': amount, 'details': details})
+    return history
+
+def timed(fn, items):
+    start = time.perf_counter()
+    results = [fn(item) for item in items]
+    return results, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--entries", type=int, default=200, help="history entries per user")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    histories = [make_history(rng, args.entries) for _ in range(args.users)]
+    records = [[(h['timestamp'], h['type'], h['amount'], h['details']) for h in history] for history in histories]
+
+    json_payloads, json_encode = timed(json.dumps, histories)
+    binary_payloads, binary_encode = timed(history_codec.encode, records)
+    _, json_decode = timed(json.loads, json_payloads)
+    decoded, binary_decode = timed(history_codec.decode, binary_payloads)
+    # Legacy rows go through the same decode() entry point
+    _, legacy_decode = timed(history_codec.decode, json_payloads)
+
+    assert decoded == records, "binary round trip changed the history"
+
+    json_size = sum(len(payload.encode('utf-8')) for payload in json_payloads)
+    binary_size = sum(len(payload) for payload in binary_payloads)
+    total = args.users * args.entries
+    print(f"{args.users} histories x {args.entries} entries ({total:,} records)\n")
+    print(f"{'encoding':<16}{'bytes':>14}{'bytes/record':>14}{'encode ms':>12}{'decode ms':>12}")
+    print(f"{'json':<16}{json_size:>14,}{json_size / total:>14.1f}{json_encode * 1000:>12.1f}{json_decode * 1000:>12.1f}")
+    print(f"{'binary':<16}{binary_size:>14,}{binary_size / total:>14.1f}{binary_encode * 1000:>12.1f}{binary_decode * 1000:>12.1f}")
+    print(f"{'json via codec':<16}{'':>14}{'':>14}{'':>12}{legacy_decode * 1000:>12.1f}")
+    print(f"\nbinary is {binary_size / json_size:.0%} of the JSON size")
+
+if __name__ == "__main__":
+    main()
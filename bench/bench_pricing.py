@@ -0,0 +1,74 @@
+# bench_pricing.py
+"""
+Benchmarks batch revaluation of stored resale values.
+
+Users are bulk-loaded into a scratch database at the old price, then
+DBWrapper.revalue applies a new price schedule in chunked transactions and
+the throughput is reported.
+
+Usage:
+    python bench/bench_pricing.py --users 1000000 --chunk-size 50000
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from libs.db_con import DBWrapper  # noqa: E402
+from libs.pricing import PriceSchedule, PricingEngine  # noqa: E402
+
+OLD_SCHEDULE = PriceSchedule(1, "2024-01-01", 480)
+NEW_SCHEDULE = PriceSchedule(2, "2025-01-01", 490)
+
+def seed(db_wrapper, users):
+    rows = (
+        (f"bench{i:07d}", f"Investor {i}", "hash", 500 * (1 + i % 20), "2024-01-01 00:00:00",
+         OLD_SCHEDULE.resale_value(500 * (1 + i % 20)))
+        for i in range(users)
+    )
+    db_wrapper.cursor.executemany('''
+        INSERT INTO users (uid, name, phone_hash, amount_invested, date_of_investment, resale_value)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    db_wrapper.connection.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_pricing_")
+    try:
+        db_path = os.path.join(workdir, "db", "users.db")
+        db_wrapper = DBWrapper(db_path, pricing=PricingEngine([OLD_SCHEDULE, NEW_SCHEDULE]))
+
+        started = time.perf_counter()
+        seed(db_wrapper, args.users)
+        print(f"Seeded {args.users} users in {time.perf_counter() - started:.2f}s")
+
+        chunks = []
+        started = time.perf_counter()
+        changed = db_wrapper.revalue(args.chunk_size, progress=lambda done, total, changed: chunks.append(done))
+        seconds = time.perf_counter() - started
+        print(f"Revalued {changed} users in {len(chunks)} chunks: {seconds:.2f}s "
+              f"({args.users / seconds:,.0f} users/s)")
+
+        started = time.perf_counter()
+        unchanged = db_wrapper.revalue(args.chunk_size)
+        print(f"Second pass changed {unchanged} users in {time.perf_counter() - started:.2f}s")
+
+        user = db_wrapper.get_user_by_uid("bench0000001")
+        assert user.resale_value == NEW_SCHEDULE.resale_value(user.amount_invested)
+        db_wrapper.close()
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# bench_storage.py
+"""
+Benchmarks the storage backends behind the Repository interface.
+
+The same workload runs against the SQLite implementation (DBWrapper, on a
+scratch file), the sharded SQLite implementation (`--shards` scratch files) and
+the in-memory implementation, and the ops/s of each step is reported side
+by side.
+
+Usage:
+    python bench/bench_storage.py --users 2000 --transactions 20
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from libs.db_con import DBWrapper  # noqa: E402
+from libs.memory_repository import InMemoryRepository  # noqa: E402
+from libs.sharded_repository import ShardedRepository  # noqa: E402
+
+def workload(repo, users, transactions):
+    """Yield (step name, operation count, callable) for each benchmark step"""
+    uids = [f"bench{i:07d}" for i in range(users)]
+    sample = random.Random(0).choices(uids, k=users)
+
+    def add_users():
+        for uid in uids:
+            repo.add_user(uid, f"Investor {uid}", "9876543210", 5000, "2024-01-01 00:00:00", None, 4800)
+
+    def add_transactions():
+        for uid in uids:
+            for i in range(transactions):
+                repo.add_transaction(uid, "verification", 0, f"Check {i}")
+
+    def lookups():
+        for uid in sample:
+            repo.get_user_by_uid(uid)
+
+    def first_pages():
+        for uid in sample:
+            repo.get_transactions_page(uid, 20)
+
+    def reinvestments():
+        for uid in sample:
+            user = repo.get_user_by_uid(uid)
+            repo.change_investment(uid, 500, user.version, "reinvestment", "Benchmark")
+
+    def transfers():
+        for sender, recipient in zip(sample, reversed(sample)):
+            if sender != recipient:
+                user = repo.get_user_by_uid(sender)
+                repo.transfer(sender, recipient, 500, user.version)
+
+    yield "add_user", users, add_users
+    yield "add_transaction", users * transactions, add_transactions
+    yield "get_user_by_uid", users, lookups
+    yield "get_transactions_page", users, first_pages
+    yield "change_investment", users, reinvestments
+    yield "transfer", users, transfers
+    yield "get_all_users", 1, repo.get_all_users
+
+def run(repo, users, transactions):
+    results = {}
+    for name, count, step in workload(repo, users, transactions):
+        start = time.perf_counter()
+        step()
+        results[name] = count / (time.perf_counter() - start)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=20, help="transactions logged per user")
+    parser.add_argument("--shards", type=int, default=4, help="files used by the sharded backend")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="crowdfunding-bench-")
+    try:
+        backends = {
+            "sqlite": DBWrapper(os.path.join(workdir, "users.db")),
+            "sharded": ShardedRepository(os.path.join(workdir, "shards"), args.shards),
+            "memory": InMemoryRepository(),
+        }
+        results = {name: run(repo, args.users, args.transactions) for name, repo in backends.items()}
+        for repo in backends.values():
+            repo.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'step':<24}" + "".join(f"{name + ' ops/s':>16}" for name in results))
+    for step in results["sqlite"]:
+        print(f"{step:<24}" + "".join(f"{results[name][step]:>16,.0f}" for name in results))
+
+if __name__ == "__main__":
+    main()
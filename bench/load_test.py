@@ -0,0 +1,505 @@
+# load_test.py
+"""
+Headless load test for the investor flows in app.py.
+
+Every simulated session is a Streamlit AppTest instance that clicks through
+the real pages (new investor registration, reinvestment, transfer and the
+public verify page) against a scratch copy of the app with its own database.
+AppTest keeps global runtime state, so concurrency comes from worker
+processes: each one behaves like an app replica serving one session at a
+time, and all of them share the scratch database file.
+
+The report covers throughput, tail latency, how long writes waited in the
+DBWriter queue, how long taking SQLite's write lock and committing took
+(taking the lock includes busy waits on other replicas' writes), and
+"database is locked" errors. Runs that end in the app's "database is busy"
+warning are reported as timed out, since their write may or may not have
+been applied. The final database is checked against a ledger of every
+operation the app reported as done, which flags lost updates and negative
+balances.
+
+With `--shards N` the scratch app runs in sharded mode (see
+libs/sharded_repository.py) and the check covers every shard.
+
+Usage:
+    python bench/load_test.py --sessions 16 --operations 400 --hot-users 5
+"""
+
+import argparse
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+import multiprocessing
+
+import yaml
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import libs.db_con as db_con  # noqa: E402
+from libs.config import load_config  # noqa: E402
+from libs.db_executor import DBWriter  # noqa: E402
+from libs.sharded_repository import ShardedRepository  # noqa: E402
+from libs.pricing import PricingEngine  # noqa: E402
+
+SECRET_CODE = "load-test-secret"
+SHARE_PRICE = 500
+# Start of the warning app.py shows when a write outlives database.write_timeout
+TIMEOUT_WARNING = "The database is busy"
+PRICING = PricingEngine.from_config(load_config(os.path.join(REPO_ROOT, "conf", "config.yaml")))
+
+# Statements that take SQLite's write lock when no transaction is open yet
+_TAKES_WRITE_LOCK = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE|BEGIN IMMEDIATE)\b', re.IGNORECASE)
+
+class TimedConnection:
+    """
+    Wraps a DBWrapper's write connection and records how long commits took
+    and how long the first write of each transaction took to get the write
+    lock. Writes within one app replica are serialized by the DBWriter
+    thread, so the latter is time spent waiting out other replicas' writes.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._samples_lock = threading.Lock()
+        self.lock_waits = []
+        self.commits = []
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def _record(self, samples, start):
+        with self._samples_lock:
+            samples.append(time.perf_counter() - start)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return self._connection.commit()
+        finally:
+            self._record(self.commits, start)
+
+    def execute_timed(self, method, sql, *args):
+        if self._connection.in_transaction or not _TAKES_WRITE_LOCK.match(sql):
+            return method(sql, *args)
+        start = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            self._record(self.lock_waits, start)
+
+    def drain(self):
+        """Return and reset the samples collected so far"""
+        with self._samples_lock:
+            sample = (self.lock_waits, self.commits)
+            self.lock_waits, self.commits = [], []
+        return sample
+
+class TimedCursor:
+    """Cursor of a TimedConnection whose statements are timed by it"""
+
+    def __init__(self, connection, cursor):
+        self._connection = connection
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, sql, *args):
+        return self._connection.execute_timed(self._cursor.execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._connection.execute_timed(self._cursor.executemany, sql, *args)
+
+def instrument_db_writes():
+    """Time the write connection of every DBWrapper, and collect every DBWriter, created from now on"""
+    connections, writers = [], []
+    original_wrapper_init = db_con.DBWrapper.__init__
+    original_writer_init = DBWriter.__init__
+
+    def wrapper_init(self, *args, **kwargs):
+        original_wrapper_init(self, *args, **kwargs)
+        self.connection = TimedConnection(self.connection)
+        self.cursor = TimedCursor(self.connection, self.cursor)
+        connections.append(self.connection)
+
+    def writer_init(self, *args, **kwargs):
+        original_writer_init(self, *args, **kwargs)
+        writers.append(self)
+
+    db_con.DBWrapper.__init__ = wrapper_init
+    DBWriter.__init__ = writer_init
+    return connections, writers
+
+def prepare_workdir(shards=1):
+    """Scratch app directory: code and template are linked, db/ and certificates are fresh and rate limits are lifted"""
+    workdir = tempfile.mkdtemp(prefix="crowdfunding-load-")
+    for name in ("app.py", "libs", "pages", os.path.join("assets", "template.docx")):
+        os.makedirs(os.path.dirname(os.path.join(workdir, name)), exist_ok=True)
+        os.symlink(os.path.join(REPO_ROOT, name), os.path.join(workdir, name))
+    # Generated certificates and cards stay in the scratch directory
+    os.makedirs(os.path.join(workdir, "assets", "certs", "cards"))
+    os.makedirs(os.path.join(workdir, "db"))
+    os.makedirs(os.path.join(workdir, "conf"))
+
+    with open(os.path.join(REPO_ROOT, "conf", "config.yaml")) as file:
+        config = yaml.safe_load(file) or {}
+    unlimited = {'capacity': 10 ** 9, 'refill_rate': 10 ** 9}
+    config['rate_limit'] = {'session': unlimited, 'client': unlimited, 'audit_interval': 60}
+    config.setdefault('database', {}).update(shards=shards, shard_directory=os.path.join('db', 'shards'))
+    with open(os.path.join(workdir, "conf", "config.yaml"), "w") as file:
+        yaml.safe_dump(config, file)
+    return workdir
+
+class Ledger:
+    """Expected balances, updated only for operations the app reported as successful"""
+
+    def __init__(self):
+        self.balances = defaultdict(int)
+
+    def apply(self, deltas):
+        for uid, delta in deltas.items():
+            self.balances[uid] += delta
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.failures = defaultdict(list)
+        self.timeouts = defaultdict(list)
+        # Investors a timed-out write may or may not have changed
+        self.unresolved = set()
+        self.lock_waits = []
+        self.commits = []
+        # Latest DBWriter.stats() of each worker process
+        self.writers = {}
+
+    def record(self, action, latency, outcome, deltas, write_sample):
+        if outcome == "timed out":
+            self.timeouts[action].append(latency)
+            self.unresolved.update(deltas)
+        elif outcome:
+            self.failures[action].append(outcome)
+        else:
+            self.latencies[action].append(latency)
+        pid, lock_waits, commits, writer_stats = write_sample
+        self.lock_waits.extend(lock_waits)
+        self.commits.extend(commits)
+        if writer_stats and writer_stats['completed'] >= self.writers.get(pid, {}).get('completed', -1):
+            self.writers[pid] = writer_stats
+
+class Session:
+    """One simulated browser session driving app.py through AppTest"""
+
+    def __init__(self, script_path, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(script_path, default_timeout=timeout)
+        self.at.run()
+
+    def errors(self):
+        return [e.value for e in self.at.error] + [str(e.value) for e in self.at.exception]
+
+    def timed_out(self):
+        return any(w.value.startswith(TIMEOUT_WARNING) for w in self.at.warning)
+
+    def timed_run(self):
+        start = time.perf_counter()
+        self.at.run()
+        return time.perf_counter() - start
+
+    def open_page(self, page):
+        self.at.session_state['current_page'] = page
+        self.at.run()
+
+    def button(self, label):
+        return next(b for b in self.at.button if b.label == label)
+
+    def new_user_investment(self, shares):
+        self.open_page('buy')
+        self.at.text_input(key="new_full_name").input(f"Load Tester {random.randrange(10 ** 6)}")
+        self.at.text_input(key="new_phone_number").input("9876543210")
+        self.at.text_input(key="new_secret_code").input(SECRET_CODE)
+        self.at.run()
+        for _ in range(shares):
+            self.at.button(key="new_add_500").click().run()
+        self.at.selectbox(key="new_cert_type").select("Small Card (₹40)")
+        self.at.checkbox(key="new_agree_tnc").check()
+        self.at.checkbox(key="new_agree_non_refund").check()
+        self.at.button(key="new_proceed").click()
+        latency = self.timed_run()
+        for markdown in self.at.markdown:
+            match = re.search(r"Your UID is: `(.+)`", markdown.value)
+            if match:
+                return latency, match.group(1)
+        return latency, None
+
+    def verify_existing(self, uid):
+        self.open_page('buy')
+        self.at.radio[0].set_value("Existing Investor").run()
+        self.at.text_input(key="existing_uid").input(uid).run()
+        self.at.button(key="verify_uid").click().run()
+        return self.at.session_state['uid_verified']
+
+    def reinvestment(self, uid, shares):
+        if not self.verify_existing(uid):
+            return None
+        self.at.radio(key="existing_action").set_value("Reinvest").run()
+        for _ in range(shares):
+            self.at.button(key="reinvest_add_500").click().run()
+        self.at.selectbox(key="reinvest_cert_type").select("No Certificate")
+        self.at.text_input(key="reinvest_secret_code").input(SECRET_CODE)
+        self.at.button(key="confirm_reinvestment").click()
+        return self.timed_run()
+
+    def transfer_investment(self, uid, target_uid, amount):
+        if not self.verify_existing(uid):
+            return None
+        self.at.radio(key="existing_action").set_value("Transfer Investment").run()
+        self.at.text_input(key="transfer_target_uid").input(target_uid)
+        self.button("Verify Recipient").click().run()
+        if self.at.session_state['transfer_step'] != 2:
+            return None
+        amount_input = self.at.number_input[0]
+        if amount > amount_input.max:
+            return None
+        amount_input.set_value(amount)
+        self.at.selectbox(key="transfer_cert_type").select("No Certificate")
+        next(t for t in self.at.text_input if t.label.startswith("Enter secret code")).input(SECRET_CODE)
+        self.button("Confirm Transfer").click()
+        return self.timed_run()
+
+    def verify_uid(self, uid):
+        self.open_page('verify')
+        self.at.text_input(key="verify_uid_input").input(uid)
+        self.at.button(key="verify_uid_button").click()
+        return self.timed_run()
+
+# State of each worker process, set up by init_worker
+_worker = {}
+
+def init_worker(workdir, timeout, hot_uids, seed):
+    os.chdir(workdir)
+    os.environ["SECRET_CODE"] = SECRET_CODE
+    random.seed(None if seed is None else seed + os.getpid())
+    _worker.update(
+        script_path=os.path.join(workdir, "app.py"),
+        timeout=timeout,
+        hot_uids=hot_uids,
+    )
+    _worker['connections'], _worker['writers'] = instrument_db_writes()
+
+def drain_writes():
+    lock_waits, commits = [], []
+    for connection in _worker['connections']:
+        sample = connection.drain()
+        lock_waits += sample[0]
+        commits += sample[1]
+    # The app keeps one DBWriter per process (st.cache_resource)
+    writer_stats = _worker['writers'][-1].stats() if _worker['writers'] else None
+    return os.getpid(), lock_waits, commits, writer_stats
+
+def run_operation(_):
+    """
+    Run one random page flow; returns (action, latency, outcome, ledger deltas, write sample).
+
+    The outcome is None on success, "timed out" if the app reported that the
+    write outlived its timeout, and the error otherwise.
+    """
+    session = Session(_worker['script_path'], _worker['timeout'])
+    action = random.choices(
+        ["new_user_investment", "reinvestment", "transfer_investment", "verify_uid"],
+        weights=[1, 3, 3, 3],
+    )[0]
+    # All traffic goes to a few hot investors to provoke conflicting writes
+    hot = _worker['hot_uids']
+    uid = random.choice(hot)
+    shares = random.randint(1, 3)
+    deltas = {}
+
+    try:
+        if action == "new_user_investment":
+            latency, new_uid = session.new_user_investment(shares)
+            if new_uid:
+                deltas = {new_uid: shares * SHARE_PRICE}
+        elif action == "reinvestment":
+            latency = session.reinvestment(uid, shares)
+            if latency is not None and not session.errors():
+                deltas = {uid: shares * SHARE_PRICE}
+        elif action == "transfer_investment":
+            target_uid = random.choice([u for u in hot if u != uid])
+            latency = session.transfer_investment(uid, target_uid, SHARE_PRICE)
+            if latency is not None and not session.errors():
+                deltas = {uid: -SHARE_PRICE, target_uid: SHARE_PRICE}
+        else:
+            latency = session.verify_uid(uid)
+    except Exception as e:
+        return action, 0, f"{type(e).__name__}: {e}", deltas, drain_writes()
+
+    errors = session.errors()
+    if latency is None:
+        outcome = "flow did not reach its submit step"
+    elif errors:
+        outcome = "; ".join(errors)
+    elif session.timed_out():
+        outcome = "timed out"
+    else:
+        outcome = None
+    return action, latency, outcome, deltas, drain_writes()
+
+def open_scratch_repository(workdir, shards):
+    if shards > 1:
+        return ShardedRepository(os.path.join(workdir, "db", "shards"), shards)
+    return db_con.DBWrapper(os.path.join(workdir, "db", "users.db"))
+
+def seed_users(db_wrapper, count, ledger):
+    uids = []
+    for i in range(count):
+        uid = f"load{i:04d}"
+        amount = 10 * SHARE_PRICE
+        db_wrapper.add_user(uid, f"Seed Investor {i}", "9876543210", amount,
+                            "2024-01-01 00:00:00", None, PRICING.resale_value(amount))
+        db_wrapper.add_transaction(uid, "investment", amount, "Initial investment")
+        ledger.apply({uid: amount})
+        uids.append(uid)
+    return uids
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def check_consistency(db_paths, ledger, unresolved=(), check_total=True):
+    """
+    Compare the database files with the ledger.
+
+    Args:
+        unresolved (set): Investors touched by timed-out writes, whose
+            balances can't be checked.
+        check_total (bool): Whether to check the total invested; it can't be
+            after a timeout, which may have registered an unknown investor.
+
+    Returns:
+        list: Problems found.
+    """
+    rows = []
+    for db_path in db_paths:
+        connection = sqlite3.connect(db_path)
+        rows.extend(connection.execute('SELECT uid, amount_invested, resale_value FROM users').fetchall())
+        connection.close()
+
+    problems = []
+    actual = {uid: amount for uid, amount, _ in rows}
+    for uid, amount, resale in rows:
+        if amount < 0:
+            problems.append(f"negative balance: {uid} has ₹{amount}")
+        if resale != PRICING.resale_value(amount):
+            problems.append(f"stale resale value: {uid} has ₹{resale} for ₹{amount}")
+    for uid, expected in ledger.balances.items():
+        if uid not in unresolved and actual.get(uid) != expected:
+            problems.append(f"lost update: {uid} expected ₹{expected}, found ₹{actual.get(uid)}")
+    expected_total = sum(ledger.balances.values())
+    actual_total = sum(actual.values())
+    if check_total and expected_total != actual_total:
+        problems.append(f"total invested expected ₹{expected_total}, found ₹{actual_total}")
+    return problems
+
+def report(stats, elapsed, problems):
+    completed = sum(len(v) for v in stats.latencies.values())
+    failed = sum(len(v) for v in stats.failures.values())
+    timed_out = sum(len(v) for v in stats.timeouts.values())
+    print(f"\n{completed} operations in {elapsed:.1f}s ({completed / elapsed:.1f} ops/s), "
+          f"{failed} failed, {timed_out} timed out")
+
+    print(f"\n{'action':<22}{'ok':>6}{'fail':>6}{'t/o':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for action in sorted(set(stats.latencies) | set(stats.failures) | set(stats.timeouts)):
+        latencies = stats.latencies.get(action) or [0]
+        print(f"{action:<22}{len(stats.latencies.get(action, [])):>6}{len(stats.failures.get(action, [])):>6}"
+              f"{len(stats.timeouts.get(action, [])):>6}"
+              f"{percentile(latencies, 0.50) * 1000:>10.1f}{percentile(latencies, 0.95) * 1000:>10.1f}"
+              f"{percentile(latencies, 0.99) * 1000:>10.1f}{max(latencies) * 1000:>10.1f}")
+
+    print("\nDB writer queue (per app replica):")
+    writes = sum(writer['completed'] for writer in stats.writers.values())
+    queue_wait = sum(writer['queue_wait'] for writer in stats.writers.values())
+    max_queue_wait = max((writer['max_queue_wait'] for writer in stats.writers.values()), default=0)
+    call_timeouts = sum(writer['timeouts'] for writer in stats.writers.values())
+    print(f"  {writes} writes, queue wait total {queue_wait * 1000:.1f} ms, "
+          f"mean {queue_wait / writes * 1000 if writes else 0:.2f} ms, max {max_queue_wait * 1000:.2f} ms, "
+          f"{call_timeouts} timed out")
+
+    print("\nSQLite writes:")
+    for name, samples in (("write lock (incl. busy waits)", stats.lock_waits), ("commit", stats.commits)):
+        count, samples = len(samples), samples or [0]
+        print(f"  {name}: {count} times, total {sum(samples) * 1000:.1f} ms, "
+              f"p50 {percentile(samples, 0.50) * 1000:.2f} ms, p99 {percentile(samples, 0.99) * 1000:.2f} ms, "
+              f"max {max(samples) * 1000:.2f} ms")
+    busy = sum(1 for errors in stats.failures.values() for e in errors if "locked" in e)
+    print(f"  'database is locked' errors: {busy}")
+
+    for action, errors in sorted(stats.failures.items()):
+        print(f"\nSample failures for {action}:")
+        for error in sorted(set(errors))[:5]:
+            print(f"  {error}")
+
+    print("\nConsistency:")
+    if problems:
+        for problem in problems[:20]:
+            print(f"  {problem}")
+        if len(problems) > 20:
+            print(f"  ... and {len(problems) - 20} more")
+    else:
+        print("  OK: balances match the ledger, no negative balances")
+    if stats.timeouts:
+        print(f"  Not checked: the total, and {len(stats.unresolved)} investors touched by timed-out writes")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent simulated sessions (worker processes)")
+    parser.add_argument("--operations", type=int, default=200, help="total page flows to run")
+    parser.add_argument("--users", type=int, default=20, help="investors seeded before the run")
+    parser.add_argument("--hot-users", type=int, default=5, help="investors that receive the traffic")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds allowed per script run")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--shards", type=int, default=1, help="run the app in sharded mode with this many files")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+    args.hot_users = max(2, min(args.hot_users, args.users))
+
+    workdir = prepare_workdir(args.shards)
+    ledger = Ledger()
+    stats = Stats()
+    db_wrapper = open_scratch_repository(workdir, args.shards)
+    uids = seed_users(db_wrapper, args.users, ledger)
+    db_paths = [shard.db_path for shard in db_wrapper.shards] if args.shards > 1 else [db_wrapper.db_path]
+    db_wrapper.close()
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.sessions, init_worker, (workdir, args.timeout, uids[:args.hot_users], args.seed)) as pool:
+        for action, latency, outcome, deltas, write_sample in pool.imap_unordered(run_operation, range(args.operations)):
+            stats.record(action, latency, outcome, deltas, write_sample)
+            if outcome is None:
+                ledger.apply(deltas)
+        # Let the workers exit on their own so writes still queued after a timeout are applied
+        pool.close()
+        pool.join()
+    elapsed = time.perf_counter() - start
+
+    problems = check_consistency(db_paths, ledger, stats.unresolved, check_total=not stats.timeouts)
+    report(stats, elapsed, problems)
+
+    if args.keep:
+        print(f"\nScratch directory kept at {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    # Workers must reach these functions by module name, since AppTest
+    # replaces __main__ with the app script in every worker process
+    import load_test
+    load_test.main()
@@ -1,9 +1,9 @@
 # admin_panel.py
 import streamlit as st
 import libs.db_con as db_con
+from libs.snapshot import get_snapshot, SORT_COLUMNS
 import os
 import json
-import pandas as pd
 import psutil
 import time
 import plotly.graph_objects as go
@@ -16,9 +16,24 @@ from pathlib import Path
 ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME")
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD")
 
+# Certificates are .docx, cards are rendered as .png and .pdf
+CERTIFICATE_MIME_TYPES = {
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.png': 'image/png',
+    '.pdf': 'application/pdf',
+}
+
 class AdminPanel:
-    def __init__(self):
-        self.db_wrapper = db_con.DBWrapper()
+    def __init__(self, db_wrapper=None, db_writer=None):
+        # Share the app's wrapper when given, so both use the same user cache
+        self.db_wrapper = db_wrapper or db_con.DBWrapper()
+        self.db_writer = db_writer
+
+    def _write(self, fn, *args):
+        # Queue on the app's writer thread when there is one
+        if self.db_writer is not None:
+            return self.db_writer.call(fn, *args)
+        return fn(*args)
 
     def admin_login(self):
         st.subheader("Admin Login")
@@ -54,42 +69,34 @@ class AdminPanel:
         if st.button("← Back"):
             st.rerun()
 
-        users = self.db_wrapper.get_all_users()
-        
-        # Convert to DataFrame - match columns with database schema
-        df = pd.DataFrame(users, columns=[
-            'UID', 'Name', 'Phone Hash', 'Email Hash', 
-            'Amount Invested', 'Date of Investment', 
-            'Resale Value', 'Certificate Type', 'Updates', 'Transactions'
-        ])
-        
+        # Shared read-only columnar snapshot, rebuilt only when the data changes
+        snapshot = get_snapshot(self.db_wrapper)
+
         # Create column filters
         col1, col2, col3, col4 = st.columns(4)
-        filters = {}
         with col1:
-            filters['Name'] = st.text_input("Filter Name")
+            name_filter = st.text_input("Filter Name")
         with col2:
-            filters['Amount Invested'] = st.text_input("Filter Amount")
+            amount_filter = st.text_input("Filter Amount")
         with col3:
-            filters['Date'] = st.text_input("Filter Date")
+            date_filter = st.text_input("Filter Date")
         with col4:
-            filters['Certificate Type'] = st.text_input("Filter Certificate")
-
-        # Apply filters using fuzzy matching
-        filtered_df = df.copy()
-        for column, search_term in filters.items():
-            if search_term:
-                if column in ['Amount Invested', 'Resale Value']:
-                    try:
-                        filtered_df = filtered_df[filtered_df[column].astype(str).str.contains(search_term, case=False)]
-                    except:
-                        pass
-                else:
-                    mask = filtered_df[column].apply(lambda x: fuzz.partial_ratio(str(x).lower(), search_term.lower()) > 75)
-                    filtered_df = filtered_df[mask]
+            cert_filter = st.text_input("Filter Certificate")
+
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            sort_column = st.selectbox("Sort by", ["None"] + list(SORT_COLUMNS))
+        with col2:
+            descending = st.checkbox("Descending")
+
+        # Filters and sorting work on row indices; only the result is materialized
+        indices = snapshot.filter(name_filter, amount_filter, date_filter, cert_filter)
+        if sort_column != "None":
+            indices = snapshot.sort(indices, sort_column, descending)
 
         # Display table
-        st.dataframe(filtered_df, use_container_width=True)
+        st.caption(f"{len(indices)} of {snapshot.size} users")
+        st.dataframe(snapshot.to_frame(indices), use_container_width=True, hide_index=True)
 
     def system_monitoring(self):
         if st.button("← Back"):
@@ -97,6 +104,24 @@ class AdminPanel:
             st.rerun()
 
         st.subheader("System Monitoring")
+
+        # Only backends with a user cache report stats
+        cache_stats = self.db_wrapper.cache_stats()
+        if cache_stats:
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("User Cache Hit Ratio", f"{cache_stats['hit_ratio']:.1%}")
+            col2.metric("Cached Users", f"{cache_stats['size']} / {cache_stats['maxsize']}")
+            col3.metric("Cache Evictions", cache_stats['evictions'])
+            col4.metric("Cache Expirations", cache_stats['expirations'])
+
+        if self.db_writer is not None:
+            writer_stats = self.db_writer.stats()
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Queued Writes", writer_stats['pending'])
+            col2.metric("Completed Writes", writer_stats['completed'])
+            col3.metric("Failed Writes", writer_stats['failed'])
+            col4.metric("Write Timeouts", writer_stats['timeouts'])
+
         while True:
             col1, col2 = st.columns(2)
 
@@ -140,9 +165,12 @@ class AdminPanel:
         cert_folder = Path("assets/certs")
         card_folder = Path("assets/certs/cards")
 
-        all_cert_files = list(cert_folder.glob("*.docx")) + list(card_folder.glob("*.docx"))
-        
-        # Process filenames for search
+        all_cert_files = [
+            file for folder in (cert_folder, card_folder) if folder.is_dir()
+            for file in sorted(folder.iterdir()) if file.suffix in CERTIFICATE_MIME_TYPES
+        ]
+
+        # Process filenames for search; a card's PNG and PDF share a name
         processed_names = {
             file: file.stem.lower().replace('_', ' ')
             for file in all_cert_files
@@ -161,60 +189,63 @@ class AdminPanel:
             )
             
             files_to_display = []
-            for _, (matched_name, score) in enumerate(matched_names):
+            # Matching against a dict yields (value, score, key) tuples
+            for matched_name, score, _ in matched_names:
                 if score > 75:
-                    # Find the file that corresponds to this name
-                    matching_file = next(
-                        (file for file, proc_name in processed_names.items() 
-                         if proc_name == matched_name),
-                        None
+                    # Find the files that correspond to this name
+                    files_to_display.extend(
+                        file for file, proc_name in processed_names.items()
+                        if proc_name == matched_name
                     )
-                    if matching_file:
-                        files_to_display.append(matching_file)
         else:
             files_to_display = all_cert_files
 
         # Display files
         for cert_file in files_to_display:
-            st.write(f"**{cert_file.stem}**")
+            st.write(f"**{cert_file.stem}** ({cert_file.suffix[1:].upper()})")
             try:
                 with open(cert_file, "rb") as file:
-                    st.download_button(
-                        label=f"Download {cert_file.name}",
-                        data=file.read(),
-                        file_name=cert_file.name,
-                        mime='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                        key=f"download_{cert_file.name}"
-                    )
+                    file_content = file.read()
+                if cert_file.suffix == '.png':
+                    st.image(file_content, width=350)
+                st.download_button(
+                    label=f"Download {cert_file.name}",
+                    data=file_content,
+                    file_name=cert_file.name,
+                    mime=CERTIFICATE_MIME_TYPES[cert_file.suffix],
+                    key=f"download_{cert_file.parent.name}_{cert_file.name}"
+                )
             except Exception as e:
                 st.error(f"Error reading file {cert_file.name}: {e}")
 
     def display_user_info(self, user):
-        uid = user[0]
-        st.markdown(f"### User: {user[1]} (UID: {uid})")
-        st.write(f"**Phone Hash:** {user[2]}")
-        st.write(f"**Email Hash:** {user[3]}")
-        st.write(f"**Amount Invested:** ₹{user[4]}")
-        st.write(f"**Date of Investment:** {user[5]}")
-        st.write(f"**Resale Value:** ₹{user[6]}")
-        st.write(f"**Certificate Type:** {user[7]}")
+        uid = user.uid
+        st.markdown(f"### User: {user.name} (UID: {uid})")
+        st.write(f"**Phone Hash:** {user.phone_hash}")
+        st.write(f"**Email Hash:** {user.email_hash}")
+        st.write(f"**Amount Invested:** ₹{user.amount_invested}")
+        st.write(f"**Date of Investment:** {user.date_of_investment}")
+        st.write(f"**Resale Value:** ₹{user.resale_value}")
+        st.write(f"**Certificate Type:** {user.certificate_type}")
 
         # Allow editing each field
         if st.checkbox(f"Edit User {uid}", key=f"edit_{uid}"):
-            new_name = st.text_input("Name", value=user[1], key=f"name_{uid}")
-            new_amount = st.number_input("Amount Invested", value=user[4], step=500, key=f"amount_{uid}")
-            new_resale = st.number_input("Resale Value", value=user[6], key=f"resale_{uid}")
+            new_name = st.text_input("Name", value=user.name, key=f"name_{uid}")
+            new_amount = st.number_input("Amount Invested", value=user.amount_invested, step=500, key=f"amount_{uid}")
+            new_resale = st.number_input("Resale Value", value=user.resale_value, key=f"resale_{uid}")
             cert_options = ["Small Card (₹40)", "A4 Sized Certificate (₹80)"]
-            cert_index = cert_options.index(user[7]) if user[7] in cert_options else 0
+            cert_index = cert_options.index(user.certificate_type) if user.certificate_type in cert_options else 0
             new_certificate_type = st.selectbox("Certificate Type", cert_options, index=cert_index, key=f"cert_type_{uid}")
 
             if st.button("Update User", key=f"update_{uid}"):
                 try:
                     # Update user fields
-                    self.db_wrapper.update_user_field(uid, 'name', new_name)
-                    self.db_wrapper.update_user_field(uid, 'amount_invested', new_amount)
-                    self.db_wrapper.update_user_field(uid, 'resale_value', new_resale)
-                    self.db_wrapper.update_user_field(uid, 'certificate_type', new_certificate_type)
+                    def update_fields():
+                        self.db_wrapper.update_user_field(uid, 'name', new_name)
+                        self.db_wrapper.update_user_field(uid, 'amount_invested', new_amount)
+                        self.db_wrapper.update_user_field(uid, 'resale_value', new_resale)
+                        self.db_wrapper.update_user_field(uid, 'certificate_type', new_certificate_type)
+                    self._write(update_fields)
                     st.success("User updated successfully.")
                     st.rerun()
                 except Exception as e:
@@ -225,7 +256,7 @@ class AdminPanel:
             confirm_delete = st.checkbox(f"Are you sure you want to delete user {uid}? This action cannot be undone.", key=f"confirm_delete_{uid}")
             if confirm_delete:
                 try:
-                    self.db_wrapper.delete_user(uid)
+                    self._write(self.db_wrapper.delete_user, uid)
                     st.success("User deleted successfully.")
                     st.rerun()
                 except Exception as e:
@@ -244,22 +275,22 @@ class AdminPanel:
                     if st.button(f"Download {cert_file.name}", key=f"download_{cert_file.name}"):
                         # Check if it's the first download
                         transactions = self.db_wrapper.get_transactions(uid)
-                        download_transactions = [txn for txn in transactions if txn['type'] == 'certificate_download' and txn['details'] == cert_file.name]
+                        download_transactions = [txn for txn in transactions if txn.type == 'certificate_download' and txn.details == cert_file.name]
 
                         if not download_transactions:
                             st.write("**This is the original copy.**")
                             # Log as original copy download
-                            self.db_wrapper.add_transaction(uid, 'certificate_download', 0, f"{cert_file.name} - Original")
+                            self._write(self.db_wrapper.add_transaction, uid, 'certificate_download', 0, f"{cert_file.name} - Original")
                         else:
                             st.write("**This is a duplicate copy.**")
                             # Log as duplicate copy download
-                            self.db_wrapper.add_transaction(uid, 'certificate_download', 0, f"{cert_file.name} - Duplicate")
+                            self._write(self.db_wrapper.add_transaction, uid, 'certificate_download', 0, f"{cert_file.name} - Duplicate")
 
                         st.download_button(
                             label="Download File",
                             data=file_content,
                             file_name=cert_file.name,
-                            mime='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+                            mime=CERTIFICATE_MIME_TYPES.get(cert_file.suffix, 'application/octet-stream'),
                         )
                 except Exception as e:
                     st.error(f"Error reading file {cert_file.name}: {e}")
@@ -0,0 +1,352 @@
+# backup.py
+"""
+Online backups of users.db.
+
+Snapshots are taken with SQLite's backup API, which copies a few pages at a
+time and lets writers in between steps, so the app keeps running while a
+backup is made. Each snapshot is gzipped as
+`users-<YYYYmmdd-HHMMSS>.db.gz` next to a `.sha256` file in sha256sum
+format, so it can also be checked with `sha256sum -c`.
+
+With `database.shards` above 1 every shard is backed up, as of the same
+moment, into its own subdirectory (`users-0/`, `users-1/`, ...) with the
+same snapshot name. Cross-shard transfers are logged inside the shards, so
+a set restored together is consistent.
+
+Usage:
+    python -m libs.backup create              take a snapshot (or a set of shard snapshots) and apply retention
+    python -m libs.backup list                list snapshots, newest first
+    python -m libs.backup verify SNAPSHOT     check a snapshot's checksum
+    python -m libs.backup restore SNAPSHOT TARGET
+                                              restore into a new database file
+"""
+
+import gzip
+import hashlib
+import os
+import pathlib
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+from libs.config import load_config
+
+SUFFIX = '.db.gz'
+TIMESTAMP_FORMAT = '%Y%m%d-%H%M%S'
+CHUNK_SIZE = 1024 * 1024
+
+class BackupError(Exception):
+    """Raised when a snapshot is missing, corrupt or cannot be restored."""
+
+class _Restarted(Exception):
+    pass
+
+def _copy_database(source, target, pages_per_step, sleep, max_restarts):
+    # A commit through another connection between steps makes SQLite start
+    # the copy over. Under constant writes that never ends, so after
+    # `max_restarts` the rest is copied in one step under a single read lock.
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > max_restarts:
+                raise _Restarted()
+        state['remaining'] = remaining
+
+    try:
+        source.backup(target, pages=pages_per_step, progress=progress, sleep=sleep)
+    except _Restarted:
+        source.backup(target, pages=-1)
+    return state['restarts']
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _snapshot_time(path):
+    name = os.path.basename(path)
+    return datetime.strptime(name[len('users-'):-len(SUFFIX)], TIMESTAMP_FORMAT)
+
+def _open_source(db_path):
+    if not os.path.isfile(db_path):
+        raise BackupError(f'Database {db_path} does not exist.')
+    # Read-only, so a path that vanished after the check is an error, not a new empty database
+    return sqlite3.connect(pathlib.Path(db_path).absolute().as_uri() + '?mode=ro', uri=True, isolation_level=None)
+
+def create_snapshot(db_path='db/users.db', backup_dir='db/backups', pages_per_step=256, sleep=0.005, max_restarts=3):
+    """
+    Copy a live database into a compressed, checksummed snapshot.
+
+    Args:
+        db_path (str): Database to back up.
+        backup_dir (str): Directory the snapshot is written to.
+        pages_per_step (int): Pages copied per step; writers may run between steps.
+        sleep (float): Seconds to pause between steps.
+        max_restarts (int): Restarts caused by concurrent writes before the
+            remaining copy is done in a single step.
+
+    Returns:
+        dict: path, checksum, database and compressed sizes in bytes, copy
+        restarts, seconds spent copying and compressing, and throughput in MB/s.
+
+    Raises:
+        BackupError: If `db_path` does not exist.
+    """
+    source = _open_source(db_path)
+    try:
+        return _write_snapshot(source, backup_dir, datetime.now(), pages_per_step, sleep, max_restarts)
+    finally:
+        source.close()
+
+def create_snapshot_set(db_paths, backup_dir='db/backups', pages_per_step=256, sleep=0.005, max_restarts=3,
+                        lock_timeout=10):
+    """
+    Snapshot several databases as of one moment, e.g. the shards of a
+    ShardedRepository. Each goes into a subdirectory of `backup_dir` named
+    after its file, and all snapshots of the set share one name.
+
+    Every database's write lock is held just long enough to start a read
+    transaction on each of them; the copies then read those transactions
+    while writers carry on.
+
+    Args:
+        db_paths (list): Databases to back up.
+        lock_timeout (float): Seconds to wait for each write lock.
+        Others as for create_snapshot.
+
+    Returns:
+        list: create_snapshot's result for each database, in order.
+
+    Raises:
+        BackupError: If a database does not exist.
+    """
+    sources = []
+    lockers = []
+    try:
+        for db_path in db_paths:
+            sources.append(_open_source(db_path))
+        # With every write lock held nothing commits anywhere, so the read
+        # transactions all start from the same moment. Writes to a shard only
+        # ever hold that shard's lock, so taking them in order can't deadlock.
+        try:
+            for db_path in db_paths:
+                locker = sqlite3.connect(db_path, timeout=lock_timeout, isolation_level=None)
+                lockers.append(locker)
+                locker.execute('BEGIN IMMEDIATE')
+            for source in sources:
+                source.execute('BEGIN')
+                source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            for locker in lockers:
+                locker.execute('ROLLBACK')
+        except sqlite3.OperationalError as e:
+            raise BackupError(f'Could not start a consistent snapshot: {e}')
+
+        taken = datetime.now()
+        snapshots = []
+        for db_path, source in zip(db_paths, sources):
+            name = os.path.splitext(os.path.basename(db_path))[0]
+            snapshots.append(_write_snapshot(source, os.path.join(backup_dir, name), taken,
+                                             pages_per_step, sleep, max_restarts))
+        return snapshots
+    finally:
+        for connection in lockers + sources:
+            connection.close()
+
+def _write_snapshot(source, backup_dir, taken, pages_per_step, sleep, max_restarts):
+    os.makedirs(backup_dir, exist_ok=True)
+    name = f"users-{taken.strftime(TIMESTAMP_FORMAT)}{SUFFIX}"
+    path = os.path.join(backup_dir, name)
+    if os.path.exists(path):
+        raise BackupError(f'Snapshot {path} already exists.')
+    copy_path = path[:-len('.gz')] + '.tmp'
+
+    started = time.perf_counter()
+    target = sqlite3.connect(copy_path)
+    try:
+        restarts = _copy_database(source, target, pages_per_step, sleep, max_restarts)
+    finally:
+        target.close()
+    copied = time.perf_counter()
+
+    try:
+        with open(copy_path, 'rb') as raw, gzip.open(path + '.tmp', 'wb', compresslevel=6) as compressed:
+            shutil.copyfileobj(raw, compressed, CHUNK_SIZE)
+        db_size = os.path.getsize(copy_path)
+    finally:
+        os.remove(copy_path)
+    # Only a complete snapshot ever gets the final name
+    os.replace(path + '.tmp', path)
+
+    checksum = _sha256(path)
+    with open(path + '.sha256', 'w') as file:
+        file.write(f"{checksum}  {name}\n")
+    finished = time.perf_counter()
+
+    return {
+        'path': path,
+        'checksum': checksum,
+        'db_bytes': db_size,
+        'compressed_bytes': os.path.getsize(path),
+        'restarts': restarts,
+        'copy_seconds': copied - started,
+        'compress_seconds': finished - copied,
+        'mb_per_second': db_size / (1024 * 1024) / max(finished - started, 1e-9),
+    }
+
+def list_snapshots(backup_dir='db/backups'):
+    """Return snapshot paths in `backup_dir`, newest first"""
+    if not os.path.isdir(backup_dir):
+        return []
+    paths = [
+        os.path.join(backup_dir, name) for name in os.listdir(backup_dir)
+        if name.startswith('users-') and name.endswith(SUFFIX)
+    ]
+    return sorted(paths, key=_snapshot_time, reverse=True)
+
+def verify_snapshot(path):
+    """
+    Check a snapshot against its recorded checksum.
+
+    Raises:
+        BackupError: If the snapshot or its checksum file is missing, or they don't match.
+    """
+    if not os.path.exists(path) or not os.path.exists(path + '.sha256'):
+        raise BackupError(f'Snapshot {path} or its checksum file is missing.')
+    with open(path + '.sha256') as file:
+        expected = file.read().split()[0]
+    if _sha256(path) != expected:
+        raise BackupError(f'Checksum mismatch for {path}.')
+    return True
+
+def apply_retention(backup_dir='db/backups', keep_last=7, keep_days=30, now=None):
+    """
+    Delete snapshots outside the retention rules.
+
+    The newest `keep_last` snapshots are always kept, plus the newest snapshot
+    of each day for the last `keep_days` days.
+
+    Returns:
+        list: Paths of the deleted snapshots.
+    """
+    now = now or datetime.now()
+    snapshots = list_snapshots(backup_dir)
+    keep = set(snapshots[:keep_last])
+    days_seen = set()
+    for path in snapshots:
+        taken = _snapshot_time(path)
+        if taken.date() not in days_seen and now - taken <= timedelta(days=keep_days):
+            days_seen.add(taken.date())
+            keep.add(path)
+
+    deleted = []
+    for path in snapshots:
+        if path not in keep:
+            os.remove(path)
+            if os.path.exists(path + '.sha256'):
+                os.remove(path + '.sha256')
+            deleted.append(path)
+    return deleted
+
+def restore_snapshot(path, target_path):
+    """
+    Restore a snapshot into a new database file, e.g. a scratch copy for audits.
+
+    The checksum is verified first and the restored database must pass
+    PRAGMA integrity_check. An existing `target_path` is never overwritten.
+
+    Returns:
+        str: `target_path`.
+    """
+    if os.path.exists(target_path):
+        raise BackupError(f'{target_path} already exists; restore into a new file.')
+    verify_snapshot(path)
+    target_dir = os.path.dirname(target_path)
+    if target_dir:
+        os.makedirs(target_dir, exist_ok=True)
+
+    with gzip.open(path, 'rb') as compressed, open(target_path + '.tmp', 'wb') as raw:
+        shutil.copyfileobj(compressed, raw, CHUNK_SIZE)
+    connection = sqlite3.connect(target_path + '.tmp')
+    try:
+        result = connection.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        connection.close()
+    if result != 'ok':
+        os.remove(target_path + '.tmp')
+        raise BackupError(f'Restored database failed the integrity check: {result}')
+    os.replace(target_path + '.tmp', target_path)
+    return target_path
+
+def backup_directories(config=None):
+    """Snapshot directories for the configured storage: one, or one per shard"""
+    config = load_config() if config is None else config
+    database = config.get('database', {})
+    backup_dir = config.get('backup', {}).get('directory', 'db/backups')
+    if database.get('shards', 1) > 1:
+        return [os.path.join(backup_dir, os.path.splitext(os.path.basename(path))[0])
+                for path in _shard_paths(database)]
+    return [backup_dir]
+
+def _shard_paths(database):
+    # Imported here so single-file backups don't load the storage layer
+    from libs.sharded_repository import shard_path
+    return [shard_path(database.get('shard_directory', 'db/shards'), index) for index in range(database['shards'])]
+
+def backup_from_config(config=None):
+    """
+    Take a snapshot and apply retention using the `backup` config section.
+    With `database.shards` above 1 every shard is backed up as one set.
+
+    Returns:
+        list: One snapshot per database, each with the paths retention deleted.
+    """
+    config = load_config() if config is None else config
+    settings = config.get('backup', {})
+    backup_dir = settings.get('directory', 'db/backups')
+    options = {
+        'pages_per_step': settings.get('pages_per_step', 256),
+        'sleep': settings.get('step_sleep', 0.005),
+        'max_restarts': settings.get('max_restarts', 3),
+    }
+    database = config.get('database', {})
+    if database.get('shards', 1) > 1:
+        snapshots = create_snapshot_set(_shard_paths(database), backup_dir, **options)
+    else:
+        snapshots = [create_snapshot(settings.get('database', 'db/users.db'), backup_dir, **options)]
+    # Shard snapshots of a set share their name, so retention keeps or drops whole sets
+    for snapshot in snapshots:
+        snapshot['deleted'] = apply_retention(os.path.dirname(snapshot['path']), settings.get('keep_last', 7),
+                                              settings.get('keep_days', 30))
+    return snapshots
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        if command == 'create':
+            for snapshot in backup_from_config():
+                print(f"Wrote {snapshot['path']} ({snapshot['db_bytes']} -> {snapshot['compressed_bytes']} bytes)")
+                print(f"  copy {snapshot['copy_seconds']:.2f}s ({snapshot['restarts']} restarts), compress {snapshot['compress_seconds']:.2f}s, "
+                      f"{snapshot['mb_per_second']:.1f} MB/s")
+                for path in snapshot['deleted']:
+                    print(f"  removed {path}")
+        elif command == 'list':
+            for backup_dir in backup_directories():
+                for path in list_snapshots(backup_dir):
+                    print(f"{path}  {os.path.getsize(path)} bytes")
+        elif command == 'verify' and len(sys.argv) == 3:
+            verify_snapshot(sys.argv[2])
+            print(f"{sys.argv[2]}: OK")
+        elif command == 'restore' and len(sys.argv) == 4:
+            print(f"Restored to {restore_snapshot(sys.argv[2], sys.argv[3])}")
+        else:
+            print(__doc__)
+            sys.exit(1)
+    except BackupError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,216 @@
+"""
+Small Card certificates: renders card-sized certificates as PNG and PDF.
+
+Usage:
+    python -m libs.cardGen render-all [processes]   re-render the card of every Small Card investor
+"""
+
+from PIL import Image, ImageDraw, ImageFont
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import os
+import stat
+import platform
+import tempfile
+
+# 3.5 x 2 inch card at 300 dpi
+CARD_SIZE = (1050, 600)
+DPI = 300
+FORMATS = ('png', 'pdf')
+
+BACKGROUND_TOP = (18, 52, 86)
+BACKGROUND_BOTTOM = (44, 110, 150)
+ACCENT = (222, 184, 92)
+TEXT = (255, 255, 255)
+MUTED = (205, 220, 232)
+
+@functools.lru_cache(maxsize=4)
+def card_background(size=CARD_SIZE):
+    """
+    Renders the card background once per process: a vertical gradient with an
+    inset border. Callers get the cached image and must copy it before drawing.
+
+    Args:
+        size (tuple): Card size in pixels.
+
+    Returns:
+        PIL.Image.Image: The background image.
+    """
+    width, height = size
+    # Build the gradient as a single column and stretch it across the card
+    column = Image.new('RGB', (1, height))
+    for y in range(height):
+        t = y / max(height - 1, 1)
+        column.putpixel((0, y), tuple(round(a + (b - a) * t) for a, b in zip(BACKGROUND_TOP, BACKGROUND_BOTTOM)))
+    background = column.resize(size)
+
+    draw = ImageDraw.Draw(background)
+    margin = height // 20
+    draw.rectangle([margin, margin, width - margin, height - margin], outline=ACCENT, width=max(height // 150, 1))
+    draw.line([(margin * 3, height * 0.3), (width - margin * 3, height * 0.3)], fill=ACCENT, width=2)
+    return background
+
+@functools.lru_cache(maxsize=16)
+def card_font(size, font_path=None):
+    """
+    Loads a font once per process.
+
+    Args:
+        size (int): Font size in pixels.
+        font_path (str): TrueType font file; Pillow's bundled font when None.
+
+    Returns:
+        PIL.ImageFont.FreeTypeFont: The font.
+    """
+    if font_path:
+        return ImageFont.truetype(font_path, size)
+    return ImageFont.load_default(size)
+
+def render_card(details, size=CARD_SIZE, font_path=None):
+    """
+    Draws a card from the same details dict used for the .docx certificate.
+
+    Args:
+        details (dict): Dictionary containing placeholders and their replacements.
+        size (tuple): Card size in pixels.
+        font_path (str): TrueType font file for the card text.
+
+    Returns:
+        PIL.Image.Image: The rendered card.
+    """
+    width, height = size
+    card = card_background(size).copy()
+    draw = ImageDraw.Draw(card)
+
+    def centered(text, y, font_size, fill):
+        # Shrink long text (mostly names) until it fits inside the border
+        font = card_font(font_size, font_path)
+        while font_size > 10 and draw.textlength(text, font=font) > width * 0.85:
+            font_size -= 4
+            font = card_font(font_size, font_path)
+        draw.text((width / 2, y), text, font=font, fill=fill, anchor='mm')
+
+    centered("CERTIFICATE OF PROFIT SHARE", height * 0.19, height // 16, ACCENT)
+    centered(details.get("{name}", ""), height * 0.44, height // 9, TEXT)
+    centered(f"holds {details.get('{percentage}', '')} profit shares", height * 0.60, height // 16, MUTED)
+    centered(details.get("{date}", ""), height * 0.72, height // 20, MUTED)
+    centered(f"UID - {details.get('{uid}', '')}", height * 0.86, height // 18, TEXT)
+    return card
+
+def _make_read_only(path):
+    if platform.system() == 'Windows':
+        os.chmod(path, stat.S_IREAD)
+    else:
+        os.chmod(path, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+
+def generate_card(output_dir, details, formats=FORMATS, font_path=None):
+    """
+    Generates a card-sized certificate as PNG and/or PDF.
+
+    Args:
+        output_dir (str): Directory to save the generated card.
+        details (dict): Dictionary containing placeholders and their replacements.
+        formats (tuple): Any of 'png' and 'pdf'.
+        font_path (str): TrueType font file for the card text.
+
+    Returns:
+        list: Paths of the generated files.
+    """
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"Unsupported card format: {', '.join(sorted(unknown))}")
+
+    card = render_card(details, font_path=font_path)
+    os.makedirs(output_dir, exist_ok=True)
+    # The UID keeps cards of users with the same name apart
+    user_name = details.get("{name}", "output").replace(" ", "_")
+    file_stem = f"{user_name}_{details['{uid}']}" if details.get("{uid}") else user_name
+
+    paths = []
+    for file_format in formats:
+        output_path = os.path.join(output_dir, f"{file_stem}.{file_format}")
+        _save_read_only(card, output_path, file_format)
+        paths.append(output_path)
+    return paths
+
+def _save_read_only(card, output_path, file_format):
+    # Save next to the target and swap it in, so a card regenerated for the
+    # same user (e.g. after a reinvestment) replaces the read-only one
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(output_path))
+    os.close(fd)
+    try:
+        if file_format == 'png':
+            card.save(temp_path, 'PNG', dpi=(DPI, DPI))
+        else:
+            card.save(temp_path, 'PDF', resolution=DPI)
+        _make_read_only(temp_path)
+        if platform.system() == 'Windows' and os.path.exists(output_path):
+            # Windows won't replace a read-only file
+            os.chmod(output_path, stat.S_IREAD | stat.S_IWRITE)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.chmod(temp_path, stat.S_IREAD | stat.S_IWRITE)
+            os.remove(temp_path)
+        raise
+
+def _warm_cache(font_path):
+    # Run once per worker so every card after the first reuses the background and fonts
+    render_card({}, font_path=font_path)
+
+def generate_cards(output_dir, details_list, formats=FORMATS, font_path=None, processes=None):
+    """
+    Generates many cards over a process pool.
+
+    Args:
+        output_dir (str): Directory to save the generated cards.
+        details_list (list): One details dict per card.
+        formats (tuple): Any of 'png' and 'pdf'.
+        font_path (str): TrueType font file for the card text.
+        processes (int): Worker processes; defaults to the CPU count.
+
+    Returns:
+        list: For each details dict, the paths of its generated files.
+    """
+    with ProcessPoolExecutor(processes, initializer=_warm_cache, initargs=(font_path,)) as executor:
+        return list(executor.map(
+            functools.partial(generate_card, output_dir, formats=formats, font_path=font_path),
+            details_list,
+            chunksize=16,
+        ))
+
+if __name__ == "__main__":
+    import sys
+    from datetime import datetime
+
+    from libs.config import load_config
+    from libs.repository import SHARE_PRICE
+    from libs.sharded_repository import open_repository
+    # Pool workers must reach the card functions by module name, not as __main__
+    from libs.cardGen import generate_cards as render_cards
+
+    if len(sys.argv) not in (2, 3) or sys.argv[1] != 'render-all':
+        print(__doc__)
+        sys.exit(1)
+    processes = int(sys.argv[2]) if len(sys.argv) == 3 else None
+
+    repository = open_repository(read_pool_size=1)
+    try:
+        users = [user for user in repository.get_all_users() if user.certificate_type == "Small Card (₹40)"]
+    finally:
+        repository.close()
+
+    # Same details as the card the app generates on purchase and reinvestment
+    current_date = datetime.now().strftime("%d %B %Y")
+    details_list = [
+        {"{name}": user.name, "{date}": current_date,
+         "{percentage}": f"{0.5 * (user.amount_invested // SHARE_PRICE)}%", "{uid}": user.uid}
+        for user in users
+    ]
+    card_config = load_config().get('cards', {})
+    output_dir = os.path.join("assets", "certs", "cards")
+    render_cards(output_dir, details_list, formats=tuple(card_config.get('formats', FORMATS)),
+                 font_path=card_config.get('font_path'), processes=processes)
+    print(f"Rendered {len(details_list)} cards into {output_dir}")
+
+# Coded with ❤️ by a3ro-dev
@@ -1,8 +1,89 @@
 from docx import Document
+from docx.oxml.ns import qn
+import functools
 import os
+import re
 import stat
 import platform
 
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+@functools.lru_cache(maxsize=32)
+def compile_placeholders(keys):
+    """
+    Compiles placeholders into a single alternation, longest first so that
+    a placeholder which is a prefix of another never wins.
+
+    Args:
+        keys (tuple): The placeholders.
+
+    Returns:
+        re.Pattern: Pattern matching any of the placeholders.
+    """
+    return re.compile('|'.join(re.escape(key) for key in sorted(keys, key=len, reverse=True)))
+
+def _replace_in_paragraph(text_nodes, pattern, details):
+    # A placeholder can be split over several runs, so match on the joined
+    # text and write each replacement into the run where its match starts.
+    # The other runs only lose the characters they held, keeping their formatting.
+    joined = ''.join(node.text or '' for node in text_nodes)
+    matches = list(pattern.finditer(joined))
+    if not matches:
+        return 0
+
+    index = 0
+    end = 0
+    for node in text_nodes:
+        start, end = end, end + len(node.text or '')
+        pieces = []
+        position = start
+        while position < end:
+            match = matches[index] if index < len(matches) else None
+            if match is None or match.start() >= end:
+                pieces.append(joined[position:end])
+                position = end
+            elif match.start() > position:
+                pieces.append(joined[position:match.start()])
+                position = match.start()
+            else:
+                if position == match.start():
+                    pieces.append(str(details[match.group()]))
+                position = min(match.end(), end)
+                if position == match.end():
+                    index += 1
+        new_text = ''.join(pieces)
+        if new_text != node.text:
+            node.text = new_text
+            node.set(XML_SPACE, 'preserve')
+    return len(matches)
+
+def substitute_placeholders(element, details):
+    """
+    Replaces placeholders in every paragraph under an XML element, including
+    paragraphs inside text boxes and shapes, in a single pass over the tree.
+
+    Args:
+        element: Root XML element, e.g. `Document(...).element`.
+        details (dict): Dictionary containing placeholders and their replacements.
+
+    Returns:
+        int: Number of placeholders replaced.
+    """
+    if not details:
+        return 0
+    pattern = compile_placeholders(tuple(details))
+
+    # Group text nodes by their nearest paragraph, in document order
+    paragraphs = {}
+    paragraph_tag = qn('w:p')
+    for text_node in element.iter(qn('w:t')):
+        parent = text_node.getparent()
+        while parent is not None and parent.tag != paragraph_tag:
+            parent = parent.getparent()
+        paragraphs.setdefault(parent, []).append(text_node)
+
+    return sum(_replace_in_paragraph(nodes, pattern, details) for nodes in paragraphs.values())
+
 def generate_docx_with_shapes(template_path, output_dir, details):
     """
     Generates a .docx certificate by replacing placeholders with actual details.
@@ -17,17 +98,8 @@ def generate_docx_with_shapes(template_path, output_dir, details):
     """
     doc = Document(template_path)
 
-    # Replace text in paragraphs
-    for paragraph in doc.paragraphs:
-        for key, value in details.items():
-            if key in paragraph.text:
-                paragraph.text = paragraph.text.replace(key, value)
-
-    # Replace text in text boxes and shapes
-    for shape in doc.element.xpath('//w:drawing//w:t'):
-        for key, value in details.items():
-            if key in shape.text:
-                shape.text = shape.text.replace(key, value)
+    # Replace text in paragraphs, text boxes and shapes
+    substitute_placeholders(doc.element, details)
 
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
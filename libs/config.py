@@ -0,0 +1,21 @@
+# config.py
+
+import os
+import yaml
+
+CONFIG_PATH = os.path.join('conf', 'config.yaml')
+
+def load_config(path=CONFIG_PATH):
+    """
+    Loads the application settings.
+
+    Args:
+        path (str): Path to the YAML config file.
+
+    Returns:
+        dict: The parsed settings, or an empty dict if the file is missing or empty.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return yaml.safe_load(file) or {}
@@ -1,173 +1,684 @@
 # db_con.py
 
 import sqlite3
-import hashlib
 import os
-import re
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import functools
 import threading
+import time
 
-class DBWrapper:
-    def __init__(self, db_path='db/users.db'):
+from libs.cache import LRUCache
+from libs.db_executor import ReadConnectionPool
+import libs.history_codec as history_codec
+import libs.migrations as migrations
+from libs.pricing import PricingEngine
+from libs.records import User, Transaction
+from libs.repository import Repository, ConcurrencyError, ActionPendingError, DuplicateUserError, EDITABLE_FIELDS, SHARE_PRICE, COMMITTED, REFUNDED
+
+# Explicit column list, so the legacy JSON columns are never read
+USER_COLUMNS = 'uid, name, phone_hash, email_hash, amount_invested, date_of_investment, resale_value, certificate_type, version'
+
+class DBWrapper(Repository):
+    """SQLite implementation of the storage interface"""
+
+    def __init__(self, db_path='db/users.db', cache_size=1024, cache_ttl=300, negative_cache_ttl=30, pricing=None,
+                 read_pool_size=4, cache_check_interval=0.5):
         self.db_path = db_path
+        self.pricing = pricing or PricingEngine()
         self.connection = None
+        # Guards the write connection; reads use the read-only pool and never take it
         self.lock = threading.Lock()
         self._connect()
         self._create_table()
+        self.readers = ReadConnectionPool(db_path, read_pool_size)
         self._cache = None
+        self._cache_version = None
         self._cache_lock = threading.Lock()
+        self._fill_lock = threading.Lock()
+        self._write_count = 0
+        # Seconds between checks for users changed by other processes (app replicas)
+        self.cache_check_interval = cache_check_interval
+        self._checked_at = None
+        self._seen_data_version = None
+        self._seen_user_changes = None
+        # Read-through cache for get_user_by_uid; write methods invalidate their uid
+        self.user_cache = LRUCache(cache_size, cache_ttl, negative_cache_ttl)
 
     def _connect(self):
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
         self.cursor = self.connection.cursor()
+        # WAL lets the read pool keep reading while a write is being committed
+        self.cursor.execute('PRAGMA journal_mode=WAL').fetchone()
 
     def _create_table(self):
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                uid TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                phone_hash TEXT NOT NULL,
-                email_hash TEXT,
-                amount_invested INTEGER NOT NULL,
-                date_of_investment TEXT NOT NULL,
-                resale_value REAL,
-                certificate_type TEXT,
-                updates TEXT,
-                transactions TEXT
-            )
-        ''')
-        self.connection.commit()
+        # Schema changes are versioned in libs/migrations.py; this applies any pending ones
+        migrations.migrate(self.connection)
+
+    def set_trace_callback(self, callback):
+        """Pass every statement run on any of this wrapper's connections to `callback`, or None to stop"""
+        self.connection.set_trace_callback(callback)
+        self.readers.set_trace_callback(callback)
 
     def update_certificate_type(self, uid, cert_type):
         with self.lock:
-            self.cursor.execute('UPDATE users SET certificate_type = ? WHERE uid = ?', (cert_type, uid))
+            self.cursor.execute('UPDATE users SET certificate_type = ?, version = version + 1 WHERE uid = ?', (cert_type, uid))
             self.connection.commit()
-            self._cache = None  # Invalidate cache
+            self._invalidate(uid)
 
     def add_update(self, uid, update_text):
         with self.lock:
             current_time = datetime.now().isoformat()
-            self.cursor.execute('SELECT updates FROM users WHERE uid = ?', (uid,))
-            result = self.cursor.fetchone()
-            
-            if result and result[0]:
-                updates = json.loads(result[0])
+            self.cursor.execute('''
+                INSERT INTO updates (uid, timestamp, update_text)
+                SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM users WHERE uid = ?)
+            ''', (uid, current_time, update_text, uid))
+            self.connection.commit()
+
+    def _encode_updates(self, updates, encoding):
+        if encoding == 'json':
+            return json.dumps(updates)
+        return history_codec.encode_updates(updates)
+
+    def archive_updates(self, keep_last=None, older_than_days=None, encoding='binary'):
+        """
+        Move updates outside the retention policy into the archive.
+
+        Args:
+            keep_last (int): Keep only this many of the newest updates per user.
+            older_than_days (int): Archive updates older than this many days.
+            encoding (str): Payload encoding for the archive, 'binary' or 'json'.
+
+        Returns:
+            int: Number of updates archived.
+        """
+        selects = []
+        params = []
+        if keep_last is not None:
+            selects.append('''
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (PARTITION BY uid ORDER BY id DESC) AS position
+                    FROM updates
+                ) WHERE position > ?
+            ''')
+            params.append(keep_last)
+        if older_than_days is not None:
+            selects.append('SELECT id FROM updates WHERE timestamp < ?')
+            params.append((datetime.now() - timedelta(days=older_than_days)).isoformat())
+        if not selects:
+            return 0
+
+        with self.lock:
+            try:
+                self.cursor.execute('DROP TABLE IF EXISTS temp.expired_updates')
+                self.cursor.execute(
+                    'CREATE TEMP TABLE expired_updates AS ' + ' UNION '.join(selects), params
+                )
+                self.cursor.execute('''
+                    SELECT uid, timestamp, update_text FROM updates
+                    WHERE id IN (SELECT id FROM temp.expired_updates)
+                    ORDER BY uid, id
+                ''')
+                batches = {}
+                for uid, timestamp, update_text in self.cursor.fetchall():
+                    batches.setdefault(uid, []).append({'timestamp': timestamp, 'update': update_text})
+                archived_at = datetime.now().isoformat()
+                self.cursor.executemany(
+                    'INSERT INTO updates_archive_batches (uid, archived_at, payload) VALUES (?, ?, ?)',
+                    [(uid, archived_at, self._encode_updates(updates, encoding)) for uid, updates in batches.items()]
+                )
+                self.cursor.execute('DELETE FROM updates WHERE id IN (SELECT id FROM temp.expired_updates)')
+                self.cursor.execute('DROP TABLE temp.expired_updates')
+                self.connection.commit()
+            except sqlite3.Error:
+                self.connection.rollback()
+                raise
+        return sum(len(updates) for updates in batches.values())
+
+    def pack_archived_updates(self, encoding='binary'):
+        """
+        Rewrite archived updates stored one row each into encoded batches, and
+        re-encode batches stored in the other encoding.
+
+        Returns:
+            tuple: (updates rewritten, bytes before, bytes after).
+        """
+        with self.lock:
+            try:
+                self.cursor.execute('''
+                    SELECT uid, timestamp, update_text FROM updates_archive ORDER BY uid, id
+                ''')
+                batches = {}
+                before = 0
+                for uid, timestamp, update_text in self.cursor.fetchall():
+                    batches.setdefault(uid, []).append({'timestamp': timestamp, 'update': update_text})
+                    before += len(timestamp.encode('utf-8')) + len(update_text.encode('utf-8'))
+                archived_at = datetime.now().isoformat()
+                payloads = [(uid, archived_at, self._encode_updates(updates, encoding)) for uid, updates in batches.items()]
+                self.cursor.executemany(
+                    'INSERT INTO updates_archive_batches (uid, archived_at, payload) VALUES (?, ?, ?)', payloads
+                )
+                self.cursor.execute('DELETE FROM updates_archive')
+
+                # JSON payloads are stored as text, binary ones as blobs
+                stale_type = 'text' if encoding == 'binary' else 'blob'
+                self.cursor.execute(
+                    'SELECT id, payload FROM updates_archive_batches WHERE typeof(payload) = ?', (stale_type,)
+                )
+                rewritten = []
+                repacked = 0
+                for batch_id, payload in self.cursor.fetchall():
+                    updates = history_codec.decode_updates(payload)
+                    before += len(payload.encode('utf-8') if isinstance(payload, str) else payload)
+                    repacked += len(updates)
+                    rewritten.append((self._encode_updates(updates, encoding), batch_id))
+                self.cursor.executemany('UPDATE updates_archive_batches SET payload = ? WHERE id = ?', rewritten)
+                self.connection.commit()
+            except sqlite3.Error:
+                self.connection.rollback()
+                raise
+        after = sum(len(payload[2]) for payload in payloads) + sum(len(payload[0]) for payload in rewritten)
+        return sum(len(updates) for updates in batches.values()) + repacked, before, after
+
+    def revalue(self, chunk_size=50000, progress=None):
+        """
+        Recompute stored resale values with the current price schedule.
+
+        Users are updated in rowid ranges of `chunk_size`, one transaction per
+        chunk, so other writers only wait for a single chunk at a time.
+
+        Args:
+            chunk_size (int): Number of rowids covered by each transaction.
+            progress (callable): Called as progress(users scanned, total users, users changed)
+                after each chunk.
+
+        Returns:
+            int: Number of users whose resale value changed.
+        """
+        schedule = self.pricing.current()
+        with self.lock:
+            self.cursor.execute('SELECT COALESCE(MAX(rowid), 0), COUNT(*) FROM users')
+            last_rowid, total = self.cursor.fetchone()
+        scanned = changed = 0
+        for start in range(0, last_rowid, chunk_size):
+            bounds = {
+                'start': start, 'end': start + chunk_size,
+                'per_share': schedule.resale_value_per_share, 'share_price': SHARE_PRICE,
+            }
+            with self.lock:
+                try:
+                    self.cursor.execute('''
+                        UPDATE users SET resale_value = :per_share * (amount_invested / :share_price),
+                            version = version + 1
+                        WHERE rowid > :start AND rowid <= :end
+                            AND resale_value IS NOT :per_share * (amount_invested / :share_price)
+                    ''', bounds)
+                    changed += self.cursor.rowcount
+                    self.cursor.execute('SELECT COUNT(*) FROM users WHERE rowid > :start AND rowid <= :end', bounds)
+                    scanned += self.cursor.fetchone()[0]
+                    self.connection.commit()
+                except sqlite3.Error:
+                    self.connection.rollback()
+                    raise
+                finally:
+                    self._invalidate()
+                    self.user_cache.clear()
+            if progress is not None:
+                progress(min(scanned, total), total, changed)
+        return changed
+
+    def compact(self, free_ratio=0.0):
+        """
+        VACUUM the database if at least `free_ratio` of its pages are free,
+        then refresh planner statistics.
+
+        Returns:
+            bool: Whether the database was vacuumed.
+        """
+        with self.lock:
+            page_count = self.cursor.execute('PRAGMA page_count').fetchone()[0]
+            free_pages = self.cursor.execute('PRAGMA freelist_count').fetchone()[0]
+            vacuum = free_pages > 0 and free_pages >= free_ratio * page_count
+            # VACUUM cannot run inside a transaction, so commit anything pending first
+            self.connection.commit()
+            if vacuum:
+                self.cursor.execute('VACUUM')
+                self.cursor.execute('ANALYZE')
             else:
-                updates = []
-                
-            updates.append({
-                'timestamp': current_time,
-                'update': update_text
-            })
-            
-            self.cursor.execute('UPDATE users SET updates = ? WHERE uid = ?', 
-                                (json.dumps(updates), uid))
+                # Re-analyzes only tables whose statistics are out of date
+                self.cursor.execute('PRAGMA optimize')
             self.connection.commit()
-            self._cache = None  # Invalidate cache
-        
+            return vacuum
+
+    def _invalidate(self, *uids):
+        # Called under self.lock after every write to the users table
+        with self._fill_lock:
+            self._write_count += 1
+            self._cache = None
+            for uid in uids:
+                self.user_cache.invalidate(uid)
+
+    def _read(self, query, params=()):
+        with self.readers.connection() as connection:
+            return connection.execute(query, params).fetchall()
+
+    def data_version(self):
+        """
+        Token that changes whenever the users table may have changed. Commits
+        made through other connections are noticed within `cache_check_interval`.
+        """
+        self._check_external_changes()
+        # Computed resale values also change when a new price schedule takes effect
+        return (self._write_count, self.pricing.current().version)
+
     def get_all_users(self):
         with self._cache_lock:
-            if self._cache is None:
-                with self.lock:
-                    self.cursor.execute('SELECT * FROM users')
-                    self._cache = self.cursor.fetchall()
+            version = self.data_version()
+            if self._cache is None or self._cache_version != version:
+                rows = self._read(f'SELECT {USER_COLUMNS} FROM users')
+                self._cache = [self.pricing.price(User(*row)) for row in rows]
+                self._cache_version = version
             return self._cache
 
     def update_user_field(self, uid, field_name, new_value):
-        if field_name not in ['name', 'phone_hash', 'email_hash', 'amount_invested', 'date_of_investment', 'resale_value', 'certificate_type']:
+        if field_name not in EDITABLE_FIELDS:
             raise ValueError('Invalid field name')
         with self.lock:
             # Use parameterized query to prevent SQL injection
-            self.cursor.execute(f'UPDATE users SET {field_name} = ? WHERE uid = ?', (new_value, uid))
+            self.cursor.execute(f'UPDATE users SET {field_name} = ?, version = version + 1 WHERE uid = ?', (new_value, uid))
             self.connection.commit()
-            self._cache = None  # Invalidate cache
+            self._invalidate(uid)
 
     def delete_user(self, uid):
         with self.lock:
             self.cursor.execute('DELETE FROM users WHERE uid = ?', (uid,))
+            self.cursor.execute('DELETE FROM transactions WHERE uid = ?', (uid,))
+            self.cursor.execute('DELETE FROM updates WHERE uid = ?', (uid,))
+            self.cursor.execute('DELETE FROM updates_archive WHERE uid = ?', (uid,))
+            self.cursor.execute('DELETE FROM updates_archive_batches WHERE uid = ?', (uid,))
+            # Closed transfers the user sent. Open ones stay, since recover() still has to
+            # finish them, and so do credit markers of transfers the user received: the
+            # sender's shard may not have closed the transfer yet, and without the marker
+            # recover() would refund the sender for a credit that was already made.
+            self.cursor.execute("DELETE FROM transfer_log WHERE sender_uid = ? AND state != 'debited'", (uid,))
             self.connection.commit()
-            self._cache = None  # Invalidate cache
+            self._invalidate(uid)
 
     def get_updates(self, uid):
-        self.cursor.execute('SELECT updates FROM users WHERE uid = ?', (uid,))
-        result = self.cursor.fetchone()
-        return json.loads(result[0]) if result and result[0] else []
-
-    def _hash_data(self, data):
-        return hashlib.sha256(str(data).encode('utf-8')).hexdigest()
+        rows = self._read('SELECT timestamp, update_text FROM updates WHERE uid = ? ORDER BY id', (uid,))
+        return [{'timestamp': row[0], 'update': row[1]} for row in rows]
 
-    def _validate_email(self, email):
-        if email:
-            pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-            if not re.match(pattern, email):
-                raise ValueError('Invalid email format')
-        return True
+    def get_archived_updates(self, uid):
+        with self.readers.connection() as connection:
+            # One read transaction, so a concurrent pack can't move rows between the two queries
+            connection.execute('BEGIN')
+            try:
+                # Rows archived before batching, then the batches in the order they were written
+                updates = [
+                    {'timestamp': row[0], 'update': row[1]} for row in connection.execute(
+                        'SELECT timestamp, update_text FROM updates_archive WHERE uid = ? ORDER BY id', (uid,)
+                    )
+                ]
+                payloads = [row[0] for row in connection.execute(
+                    'SELECT payload FROM updates_archive_batches WHERE uid = ? ORDER BY id', (uid,)
+                )]
+            finally:
+                connection.execute('COMMIT')
+        for payload in payloads:
+            updates.extend(history_codec.decode_updates(payload))
+        # Packing old rows appends them as a new batch, so restore time order
+        updates.sort(key=lambda update: update['timestamp'])
+        return updates
 
     def add_user(self, uid, name, phone_number, amount_invested, date_of_investment, email=None, resale_value=None):
         with self.lock:
-            if amount_invested % 500 != 0:
-                raise ValueError('Amount invested must be in multiples of 500.')
+            if amount_invested % SHARE_PRICE != 0:
+                raise ValueError(f'Amount invested must be in multiples of {SHARE_PRICE}.')
             
             self._validate_email(email)
             phone_hash = self._hash_data(phone_number)
             email_hash = self._hash_data(email) if email else None
             
             self.cursor.execute('''
-                INSERT INTO users (uid, name, phone_hash, email_hash, amount_invested, date_of_investment, resale_value, transactions)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (uid, name, phone_hash, email_hash, amount_invested, date_of_investment, resale_value, '[]'))
+                INSERT INTO users (uid, name, phone_hash, email_hash, amount_invested, date_of_investment, resale_value)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (uid) DO NOTHING
+            ''', (uid, name, phone_hash, email_hash, amount_invested, date_of_investment, resale_value))
+            if self.cursor.rowcount == 0:
+                self.connection.rollback()
+                raise DuplicateUserError(f'User {uid} already exists.')
             self.connection.commit()
-            self._cache = None  # Invalidate cache
+            self._invalidate(uid)  # Also drops any cached "not found"
 
     def update_email(self, uid, new_email):
         with self.lock:
             self._validate_email(new_email)
             email_hash = self._hash_data(new_email) if new_email else None
-            self.cursor.execute('UPDATE users SET email_hash = ? WHERE uid = ?', (email_hash, uid))
+            self.cursor.execute('UPDATE users SET email_hash = ?, version = version + 1 WHERE uid = ?', (email_hash, uid))
             self.connection.commit()
-            self._cache = None  # Invalidate cache
+            self._invalidate(uid)
+
+    def _check_external_changes(self):
+        # Writes through this wrapper invalidate precisely (_invalidate); commits
+        # from other processes don't pass through it, so look for them at most
+        # once per cache_check_interval and drop everything cached if users changed
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.cache_check_interval:
+            return
+        self._checked_at = now
+        with self.lock:
+            # A connection's own commits never move its data_version
+            data_version = self.connection.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._seen_data_version:
+                return
+            self._seen_data_version = data_version
+            # Someone else committed; only changes to users matter (audit entries don't)
+            user_changes = self.connection.execute('SELECT changes FROM users_changes WHERE id = 1').fetchone()[0]
+        with self._fill_lock:
+            if user_changes != self._seen_user_changes:
+                self._seen_user_changes = user_changes
+                # Also stops fills of rows read before the change was seen
+                self._write_count += 1
+                self._cache = None
+                self.user_cache.clear()
 
-    def get_user_by_uid(self, uid):
-        self.cursor.execute('SELECT * FROM users WHERE uid = ?', (uid,))
-        return self.cursor.fetchone()
+    def get_user_by_uid(self, uid, cached=True):
+        self._check_external_changes()
+        if cached:
+            found, user = self.user_cache.get(uid)
+            if found:
+                return self.pricing.price(user)
+        write_count = self._write_count
+        rows = self._read(f'SELECT {USER_COLUMNS} FROM users WHERE uid = ?', (uid,))
+        user = User(*rows[0]) if rows else None
+        with self._fill_lock:
+            # Skip the fill if a write landed meanwhile; the row read may predate it
+            if self._write_count == write_count:
+                self.user_cache.set(uid, user)
+        return self.pricing.price(user)
+
+    def cache_stats(self):
+        return self.user_cache.stats()
 
     def update_investment(self, uid, new_amount_invested, new_resale_value):
         with self.lock:
             self.cursor.execute('''
-                UPDATE users SET amount_invested = ?, resale_value = ? WHERE uid = ?
+                UPDATE users SET amount_invested = ?, resale_value = ?, version = version + 1 WHERE uid = ?
             ''', (new_amount_invested, new_resale_value, uid))
             self.connection.commit()
-            self._cache = None  # Invalidate cache
+            self._invalidate(uid)
+
+    def _insert_transaction(self, uid, transaction_type, amount, details):
+        current_time = datetime.now().isoformat()
+        # Only log against existing users, as the old JSON column did
+        self.cursor.execute('''
+            INSERT INTO transactions (uid, timestamp, type, amount, details)
+            SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM users WHERE uid = ?)
+        ''', (uid, current_time, transaction_type, amount, details, uid))
 
     def add_transaction(self, uid, transaction_type, amount, details):
         with self.lock:
-            current_time = datetime.now().isoformat()
-            self.cursor.execute('SELECT transactions FROM users WHERE uid = ?', (uid,))
-            result = self.cursor.fetchone()
-            if result and result[0]:
-                transactions = json.loads(result[0])
-            else:
-                transactions = []
+            self._insert_transaction(uid, transaction_type, amount, details)
+            self.connection.commit()
 
-            transactions.append({
-                'timestamp': current_time,
-                'type': transaction_type,
-                'amount': amount,
-                'details': details
-            })
+    def _apply_investment_delta(self, uid, delta, expected_version=None):
+        # Relative update, so concurrent changes add up instead of overwriting each other
+        query = '''
+            UPDATE users SET amount_invested = amount_invested + ?,
+                resale_value = ? * ((amount_invested + ?) / ?),
+                version = version + 1
+            WHERE uid = ? AND amount_invested + ? >= 0
+        '''
+        params = [delta, self.pricing.current().resale_value_per_share, delta, SHARE_PRICE, uid, delta]
+        if expected_version is not None:
+            query += ' AND version = ?'
+            params.append(expected_version)
+        self.cursor.execute(query, params)
+        if self.cursor.rowcount == 1:
+            return
 
-            self.cursor.execute('UPDATE users SET transactions = ? WHERE uid = ?', 
-                                (json.dumps(transactions), uid))
-            self.connection.commit()
-            self._cache = None  # Invalidate cache
+        self.cursor.execute('SELECT amount_invested, version FROM users WHERE uid = ?', (uid,))
+        row = self.cursor.fetchone()
+        if row is None:
+            raise ValueError(f'User {uid} not found.')
+        if expected_version is not None and row[1] != expected_version:
+            raise ConcurrencyError(f'User {uid} was modified by another session.')
+        raise ValueError('Transfer amount exceeds the current investment.')
+
+    def change_investment(self, uid, delta, expected_version, transaction_type, details):
+        """
+        Add `delta` to a user's investment and log it, if the user is still at `expected_version`.
+
+        Args:
+            uid (str): The user's UID.
+            delta (int): Amount to add; negative to withdraw.
+            expected_version (int): Version of the user row the change was based on.
+            transaction_type (str): Type of the logged transaction.
+            details (str): Details of the logged transaction.
+
+        Raises:
+            ConcurrencyError: If the user was modified since `expected_version` was read.
+        """
+        self._validate_amount(delta)
+        with self.lock:
+            try:
+                self._apply_investment_delta(uid, delta, expected_version)
+                self._insert_transaction(uid, transaction_type, delta, details)
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+            finally:
+                self._invalidate(uid)
+
+    def transfer(self, sender_uid, recipient_uid, amount, sender_version):
+        """
+        Move `amount` from sender to recipient in a single database transaction.
+
+        Only the sender's version is checked: the recipient's balance is
+        changed relative to whatever it is at commit time.
+
+        Raises:
+            ConcurrencyError: If the sender was modified since `sender_version` was read.
+        """
+        self._validate_transfer(sender_uid, recipient_uid, amount)
+        with self.lock:
+            try:
+                self._apply_investment_delta(sender_uid, -amount, sender_version)
+                self._apply_investment_delta(recipient_uid, amount)
+                self._insert_transaction(sender_uid, 'transfer_out', -amount, f'Transferred to UID {recipient_uid}')
+                self._insert_transaction(recipient_uid, 'transfer_in', amount, f'Received from UID {sender_uid}')
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+            finally:
+                self._invalidate(sender_uid, recipient_uid)
+        return COMMITTED
+
+    def debit_transfer(self, transfer_id, sender_uid, recipient_uid, amount, sender_version):
+        """
+        Phase one of a transfer to a user in another shard: debit the sender
+        and record the transfer in this shard's transfer log, in one transaction.
+
+        Raises:
+            ConcurrencyError: If the sender was modified since `sender_version` was read.
+        """
+        now = time.time()
+        with self.lock:
+            try:
+                self._apply_investment_delta(sender_uid, -amount, sender_version)
+                self._insert_transaction(sender_uid, 'transfer_out', -amount, f'Transferred to UID {recipient_uid}')
+                self.cursor.execute('''
+                    INSERT INTO transfer_log (transfer_id, sender_uid, recipient_uid, amount, state, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, 'debited', ?, ?)
+                ''', (transfer_id, sender_uid, recipient_uid, amount, now, now))
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+            finally:
+                self._invalidate(sender_uid)
+
+    def credit_transfer(self, transfer_id, sender_uid, recipient_uid, amount):
+        """
+        Phase two: credit the recipient of a transfer debited in another shard, at most once.
+
+        Returns:
+            bool: False if the transfer had already been credited.
+
+        Raises:
+            ValueError: If the recipient no longer exists.
+        """
+        with self.lock:
+            try:
+                # Take the write lock before the check, so two processes can't both credit
+                self.cursor.execute('BEGIN IMMEDIATE')
+                self.cursor.execute('SELECT 1 FROM transfer_credits WHERE transfer_id = ?', (transfer_id,))
+                if self.cursor.fetchone() is not None:
+                    self.connection.commit()
+                    return False
+                self._apply_investment_delta(recipient_uid, amount)
+                self._insert_transaction(recipient_uid, 'transfer_in', amount, f'Received from UID {sender_uid}')
+                self.cursor.execute(
+                    'INSERT INTO transfer_credits (transfer_id, uid, applied_at) VALUES (?, ?, ?)',
+                    (transfer_id, recipient_uid, datetime.now().isoformat())
+                )
+                self.connection.commit()
+                return True
+            except Exception:
+                self.connection.rollback()
+                raise
+            finally:
+                self._invalidate(recipient_uid)
+
+    def finish_transfer(self, transfer_id, refund=False):
+        """
+        Close a debited transfer in the sender's transfer log, refunding the
+        sender first if the recipient could not be credited.
+
+        Returns:
+            bool: False if the transfer was already closed.
+        """
+        with self.lock:
+            try:
+                self.cursor.execute('BEGIN IMMEDIATE')
+                self.cursor.execute('''
+                    SELECT sender_uid, recipient_uid, amount FROM transfer_log
+                    WHERE transfer_id = ? AND state = 'debited'
+                ''', (transfer_id,))
+                row = self.cursor.fetchone()
+                if row is None:
+                    self.connection.commit()
+                    return False
+                sender_uid, recipient_uid, amount = row
+                if refund:
+                    self._apply_investment_delta(sender_uid, amount)
+                    self._insert_transaction(sender_uid, 'transfer_refund', amount, f'Refund: UID {recipient_uid} no longer exists')
+                self.cursor.execute(
+                    'UPDATE transfer_log SET state = ?, updated_at = ? WHERE transfer_id = ?',
+                    (REFUNDED if refund else COMMITTED, time.time(), transfer_id)
+                )
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+            self._invalidate(sender_uid)
+            return True
+
+    def get_open_transfers(self, idle_seconds=0):
+        """Return (transfer_id, sender_uid, recipient_uid, amount) of debited transfers idle for `idle_seconds`"""
+        return self._read('''
+            SELECT transfer_id, sender_uid, recipient_uid, amount FROM transfer_log
+            WHERE state = 'debited' AND updated_at <= ? ORDER BY created_at
+        ''', (time.time() - idle_seconds,))
 
     def get_transactions(self, uid):
-        self.cursor.execute('SELECT transactions FROM users WHERE uid = ?', (uid,))
-        result = self.cursor.fetchone()
-        return json.loads(result[0]) if result and result[0] else []
+        rows = self._read('''
+            SELECT id, uid, timestamp, type, amount, details FROM transactions
+            WHERE uid = ? ORDER BY timestamp, id
+        ''', (uid,))
+        return [Transaction(*row) for row in rows]
+
+    def get_transactions_page(self, uid, limit=20, cursor=None, transaction_type=None):
+        """
+        Fetch one page of a user's transactions, newest first.
+
+        Args:
+            uid (str): The user's UID.
+            limit (int): Maximum number of transactions to return.
+            cursor (tuple): (timestamp, id) of the last transaction of the previous page.
+            transaction_type (str): Only return transactions of this type.
+
+        Returns:
+            tuple: (transactions, next_cursor); next_cursor is None on the last page.
+        """
+        query = 'SELECT id, uid, timestamp, type, amount, details FROM transactions WHERE uid = ?'
+        params = [uid]
+        if transaction_type:
+            query += ' AND type = ?'
+            params.append(transaction_type)
+        if cursor:
+            query += ' AND (timestamp, id) < (?, ?)'
+            params.extend(cursor)
+        query += ' ORDER BY timestamp DESC, id DESC LIMIT ?'
+        params.append(limit + 1)
+        rows = self._read(query, params)
+        transactions = [Transaction(*row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = (transactions[-1].timestamp, transactions[-1].id)
+        return transactions, next_cursor
+
+    def get_transaction_types(self, uid):
+        rows = self._read('SELECT DISTINCT type FROM transactions WHERE uid = ? ORDER BY type', (uid,))
+        return [row[0] for row in rows]
+
+    def get_idempotent_result(self, key):
+        rows = self._read('SELECT action, result FROM idempotency_keys WHERE key = ? AND expires_at > ?', (key, time.time()))
+        if not rows:
+            return False, None
+        action, result = rows[0]
+        if result is None:
+            raise ActionPendingError(f'An earlier {action} with this key did not record its result.')
+        return True, json.loads(result)
+
+    def reserve_idempotency_key(self, key, action, ttl):
+        now = time.time()
+        with self.lock:
+            # A NULL result marks the key as in progress; an expired entry may be taken over
+            self.cursor.execute('''
+                INSERT INTO idempotency_keys (key, action, result, created_at, expires_at) VALUES (?, ?, NULL, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET action = excluded.action, result = NULL,
+                    created_at = excluded.created_at, expires_at = excluded.expires_at
+                WHERE idempotency_keys.expires_at <= ?
+            ''', (key, action, now, now + ttl, now))
+            reserved = self.cursor.rowcount == 1
+            self.connection.commit()
+            return reserved
+
+    def release_idempotency_key(self, key):
+        with self.lock:
+            self.cursor.execute('DELETE FROM idempotency_keys WHERE key = ? AND result IS NULL', (key,))
+            self.connection.commit()
+
+    def save_idempotent_result(self, key, action, result, ttl):
+        now = time.time()
+        with self.lock:
+            # Replaces an expired entry that hasn't been purged yet
+            self.cursor.execute('''
+                INSERT OR REPLACE INTO idempotency_keys (key, action, result, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (key, action, json.dumps(result), now, now + ttl))
+            self.connection.commit()
+
+    def purge_idempotency_keys(self):
+        with self.lock:
+            self.cursor.execute('DELETE FROM idempotency_keys WHERE expires_at <= ?', (time.time(),))
+            self.connection.commit()
+            return self.cursor.rowcount
 
     def close(self):
+        self.readers.close()
         self.connection.close()
\ No newline at end of file
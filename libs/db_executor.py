@@ -0,0 +1,145 @@
+# db_executor.py
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+logger = logging.getLogger(__name__)
+
+class WriteTimeoutError(TimeoutError):
+    """Raised when a write did not finish in time. It stays queued and may still be applied."""
+
+class DBWriter:
+    """
+    Runs database writes one at a time on a dedicated thread.
+
+    Page handlers submit writes instead of calling the repository directly,
+    so writes never queue up on the connection lock from many script threads
+    and a slow commit can be waited for with a timeout.
+    """
+
+    def __init__(self, timeout=10):
+        """
+        Initializes the writer thread.
+
+        Args:
+            timeout (float): Default seconds `call` waits for a result.
+        """
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._stats_lock = threading.Lock()
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._timeouts = 0
+        # Seconds writes spent queued behind other writes before they started
+        self._queue_wait = 0.0
+        self._max_queue_wait = 0.0
+
+    def _done(self, future):
+        with self._stats_lock:
+            self._completed += 1
+            if future.exception() is not None:
+                self._failed += 1
+
+    def _started(self, queued_at):
+        wait = time.perf_counter() - queued_at
+        with self._stats_lock:
+            self._queue_wait += wait
+            self._max_queue_wait = max(self._max_queue_wait, wait)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue `fn(*args, **kwargs)` on the writer thread.
+
+        Returns:
+            Future: Resolves to the return value of `fn`, or raises its exception.
+        """
+        with self._stats_lock:
+            self._submitted += 1
+        queued_at = time.perf_counter()
+
+        def run():
+            self._started(queued_at)
+            return fn(*args, **kwargs)
+
+        future = self._executor.submit(run)
+        future.add_done_callback(self._done)
+        return future
+
+    def call(self, fn, *args, timeout=None, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` on the writer thread and wait for the result.
+
+        Raises:
+            WriteTimeoutError: If the write hasn't finished within `timeout` seconds.
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            with self._stats_lock:
+                self._timeouts += 1
+            raise WriteTimeoutError('The database is busy. Your change is queued and may still be applied.') from None
+
+    def post(self, fn, *args, **kwargs):
+        """Queue a write nobody waits for, e.g. an audit entry; failures are logged"""
+        def log_failure(future):
+            if future.exception() is not None:
+                logger.warning("Background write %s failed: %s", getattr(fn, '__name__', fn), future.exception())
+        self.submit(fn, *args, **kwargs).add_done_callback(log_failure)
+
+    def stats(self):
+        """Counts of writes so far, with the total and longest time (seconds) they waited in the queue"""
+        with self._stats_lock:
+            return {
+                'pending': self._submitted - self._completed,
+                'completed': self._completed,
+                'failed': self._failed,
+                'timeouts': self._timeouts,
+                'queue_wait': self._queue_wait,
+                'max_queue_wait': self._max_queue_wait,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+class ReadConnectionPool:
+    """
+    Fixed pool of read-only connections to a WAL database.
+
+    In WAL mode readers see the last committed state without waiting for
+    the writer, so reads borrow a connection here instead of taking the
+    write connection's lock.
+    """
+
+    def __init__(self, db_path, size=4):
+        uri = f'file:{pathname2url(os.path.abspath(db_path))}?mode=ro'
+        self._connections = queue.LifoQueue()
+        self._all = []
+        for _ in range(size):
+            connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._all.append(connection)
+            self._connections.put(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self._connections.get()
+        try:
+            yield connection
+        finally:
+            self._connections.put(connection)
+
+    def set_trace_callback(self, callback):
+        for connection in self._all:
+            connection.set_trace_callback(callback)
+
+    def close(self):
+        for connection in self._all:
+            connection.close()
@@ -0,0 +1,161 @@
+# history_codec.py
+"""
+Compact binary encoding for history payloads (transactions and updates).
+
+A payload holds a batch of (timestamp, type, amount, details) records:
+
+    magic   b'CFH1'
+    header  '<IB'    record count, number of extra type names
+    extra type names, each a length byte followed by UTF-8
+    records '<BBqI'  per record: timestamp length, type code, amount, details length
+    text    UTF-8 of every record's timestamp and details, concatenated
+
+Types from TYPE_CODES are stored as one byte; any other type name goes into
+the extra names list with a code from 128 upwards. Amounts are 64-bit
+integers. Timestamps stay text so they round-trip exactly and decoding is
+plain slicing; lengths in the text block are in characters, so it is
+decoded once and then sliced.
+
+decode() also accepts the JSON arrays used before this format, so older
+rows stay readable. encode() falls back to that JSON, as UTF-8 bytes, for
+batches the binary layout can't hold: more extra type names than there are
+codes, a type name over 255 bytes or a timestamp over 255 characters.
+
+Usage:
+    python -m libs.history_codec migrate [db/users.db]
+"""
+
+import json
+import struct
+import sys
+
+MAGIC = b'CFH1'
+
+TYPE_CODES = {
+    'update': 1,
+    'investment': 2,
+    'reinvestment': 3,
+    'transfer_in': 4,
+    'transfer_out': 5,
+    'verification': 6,
+    'certificate_download': 7,
+}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+EXTRA_TYPE_CODE = 128
+MAX_EXTRA_TYPES = 256 - EXTRA_TYPE_CODE
+MAX_SHORT_LENGTH = 255  # type name bytes and timestamp characters, stored in one byte
+
+_HEADER = struct.Struct('<IB')
+_RECORD = struct.Struct('<BBqI')
+
+def encode(records):
+    """
+    Pack (timestamp, type, amount, details) tuples into a binary payload.
+
+    Returns:
+        bytes: The encoded batch, or its JSON if the binary layout can't hold it.
+    """
+    records = list(records)
+    extra_types = {}
+    packed = []
+    text = []
+    for timestamp, record_type, amount, details in records:
+        details = details or ''
+        code = TYPE_CODES.get(record_type)
+        if code is None:
+            code = extra_types.setdefault(record_type, EXTRA_TYPE_CODE + len(extra_types))
+            if (code - EXTRA_TYPE_CODE >= MAX_EXTRA_TYPES
+                    or len(record_type.encode('utf-8')) > MAX_SHORT_LENGTH):
+                return _encode_json(records)
+        if len(timestamp) > MAX_SHORT_LENGTH:
+            return _encode_json(records)
+        text.append(timestamp)
+        text.append(details)
+        packed.append(_RECORD.pack(len(timestamp), code, int(amount), len(details)))
+
+    names = b''.join(bytes([len(encoded)]) + encoded for encoded in (name.encode('utf-8') for name in extra_types))
+    return b''.join([
+        MAGIC,
+        _HEADER.pack(len(packed), len(extra_types)),
+        names,
+        b''.join(packed),
+        ''.join(text).encode('utf-8'),
+    ])
+
+def _encode_json(records):
+    return json.dumps([
+        {'timestamp': timestamp, 'type': record_type, 'amount': int(amount), 'details': details or ''}
+        for timestamp, record_type, amount, details in records
+    ]).encode('utf-8')
+
+def _decode_json(payload):
+    records = []
+    for entry in json.loads(payload):
+        if 'update' in entry:
+            records.append((entry['timestamp'], 'update', 0, entry['update']))
+        else:
+            records.append((entry['timestamp'], entry['type'], entry['amount'], entry['details']))
+    return records
+
+def decode(payload):
+    """
+    Unpack a payload produced by encode(), or a legacy JSON array.
+
+    Returns:
+        list: (timestamp, type, amount, details) tuples.
+    """
+    if not payload:
+        return []
+    if isinstance(payload, str):
+        return _decode_json(payload)
+    payload = bytes(payload)
+    if not payload.startswith(MAGIC):
+        return _decode_json(payload.decode('utf-8'))
+
+    offset = len(MAGIC)
+    count, extra_count = _HEADER.unpack_from(payload, offset)
+    offset += _HEADER.size
+    type_names = dict(TYPE_NAMES)
+    for i in range(extra_count):
+        length = payload[offset]
+        type_names[EXTRA_TYPE_CODE + i] = payload[offset + 1:offset + 1 + length].decode('utf-8')
+        offset += 1 + length
+
+    records_end = offset + count * _RECORD.size
+    text = payload[records_end:].decode('utf-8')
+    records = []
+    position = 0
+    for timestamp_length, code, amount, details_length in _RECORD.iter_unpack(payload[offset:records_end]):
+        details_start = position + timestamp_length
+        position = details_start + details_length
+        records.append((text[details_start - timestamp_length:details_start], type_names[code], amount,
+                        text[details_start:position]))
+    return records
+
+def encode_updates(updates):
+    return encode((update['timestamp'], 'update', 0, update['update']) for update in updates)
+
+def decode_updates(payload):
+    return [{'timestamp': record[0], 'update': record[3]} for record in decode(payload)]
+
+def migrate(db_path):
+    """
+    Rewrite archived updates that are still stored one row each as binary
+    batches, one per user. Returns (rows migrated, bytes before, bytes after).
+    """
+    # Imported here to keep the codec free of database dependencies
+    import libs.db_con as db_con
+
+    db_wrapper = db_con.DBWrapper(db_path)
+    try:
+        return db_wrapper.pack_archived_updates()
+    finally:
+        db_wrapper.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print(__doc__)
+        sys.exit(1)
+    path = sys.argv[2] if len(sys.argv) > 2 else 'db/users.db'
+    rows, before, after = migrate(path)
+    print(f"Packed {rows} archived updates: {before} bytes of text -> {after} bytes binary")
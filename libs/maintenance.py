@@ -0,0 +1,104 @@
+# maintenance.py
+
+import logging
+import sqlite3
+import threading
+
+from libs.config import load_config
+
+logger = logging.getLogger(__name__)
+
+class CompactionJob:
+    """Background job that applies update retention, purges expired keys and compacts the database when needed"""
+
+    def __init__(self, db_wrapper, interval=3600, keep_last=None, archive_after_days=None, encoding='binary',
+                 writer=None, vacuum_free_ratio=0.2):
+        """
+        Initializes the compaction job.
+
+        Args:
+            db_wrapper (DBWrapper): Instance of the database wrapper.
+            interval (int): Seconds between runs.
+            keep_last (int): Number of newest updates to keep per user.
+            archive_after_days (int): Age in days after which updates are archived.
+            encoding (str): Payload encoding of archived updates, 'binary' or 'json'.
+            writer (DBWriter): Writer thread of the app sharing `db_wrapper`; each
+                step is queued on it so the job never writes beside the pages.
+            vacuum_free_ratio (float): VACUUM only once at least this fraction
+                of the database's pages are free; it rewrites the whole file.
+        """
+        self.db_wrapper = db_wrapper
+        self.writer = writer
+        self.interval = interval
+        self.keep_last = keep_last
+        self.archive_after_days = archive_after_days
+        self.encoding = encoding
+        self.vacuum_free_ratio = vacuum_free_ratio
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, db_wrapper, config=None, writer=None):
+        """Build a job from the `updates` and `maintenance` config sections"""
+        config = load_config() if config is None else config
+        updates = config.get('updates', {})
+        maintenance = config.get('maintenance', {})
+        return cls(
+            db_wrapper,
+            interval=maintenance.get('compaction_interval', 3600),
+            keep_last=updates.get('keep_last'),
+            archive_after_days=updates.get('archive_after_days'),
+            encoding=updates.get('encoding', 'binary'),
+            writer=writer,
+            vacuum_free_ratio=maintenance.get('vacuum_free_ratio', 0.2),
+        )
+
+    def _write(self, fn, *args):
+        if self.writer is None:
+            return fn(*args)
+        # One queued job per step, so page writes run in between. Maintenance
+        # may take longer than a page would wait, so there is no timeout here.
+        return self.writer.submit(fn, *args).result()
+
+    def run_once(self):
+        """
+        Resolve interrupted writes, apply the retention policy, drop expired
+        idempotency keys, then VACUUM if enough of the file is free space.
+
+        Returns:
+            int: Number of updates archived.
+        """
+        self._write(self.db_wrapper.recover)
+        archived = self._write(self.db_wrapper.archive_updates, self.keep_last, self.archive_after_days, self.encoding)
+        self._write(self.db_wrapper.purge_idempotency_keys)
+        self._write(self.db_wrapper.compact, self.vacuum_free_ratio)
+        return archived
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                archived = self.run_once()
+                logger.info("Compaction archived %d updates", archived)
+            except sqlite3.Error as e:
+                # Usually another connection holding the database; try again next run
+                logger.warning("Compaction skipped: %s", e)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="db-compaction", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+if __name__ == "__main__":
+    # Run a single compaction pass: python -m libs.maintenance
+    from libs.sharded_repository import open_repository
+
+    db_wrapper = open_repository(read_pool_size=1)
+    archived = CompactionJob.from_config(db_wrapper).run_once()
+    print(f"Archived {archived} updates and compacted the database")
+    db_wrapper.close()
@@ -0,0 +1,236 @@
+# memory_repository.py
+
+import bisect
+import itertools
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from libs.pricing import PricingEngine
+from libs.records import User, Transaction
+from libs.repository import Repository, ConcurrencyError, ActionPendingError, DuplicateUserError, EDITABLE_FIELDS, SHARE_PRICE, COMMITTED
+
+# Result of an idempotency key whose action is still in progress
+_PENDING = object()
+
+class InMemoryRepository(Repository):
+    """Pure in-memory implementation of the storage interface, for tests and benchmarks"""
+
+    def __init__(self, pricing=None):
+        self.pricing = pricing or PricingEngine()
+        self.lock = threading.Lock()
+        self._users = {}
+        # Per-user history kept in (timestamp, id) order, with the sort keys alongside
+        self._transactions = defaultdict(list)
+        self._transaction_keys = defaultdict(list)
+        self._updates = defaultdict(list)
+        self._archived_updates = defaultdict(list)
+        self._ids = itertools.count(1)
+        self._idempotency_keys = {}
+        self._version = 0
+
+    def add_user(self, uid, name, phone_number, amount_invested, date_of_investment, email=None, resale_value=None):
+        if amount_invested % SHARE_PRICE != 0:
+            raise ValueError(f'Amount invested must be in multiples of {SHARE_PRICE}.')
+        self._validate_email(email)
+        with self.lock:
+            if uid in self._users:
+                raise DuplicateUserError(f'User {uid} already exists.')
+            self._users[uid] = User(
+                uid, name, self._hash_data(phone_number), self._hash_data(email) if email else None,
+                amount_invested, date_of_investment, resale_value
+            )
+            self._version += 1
+
+    def get_user_by_uid(self, uid, cached=True):
+        # Nothing is cached here; every read is current
+        return self.pricing.price(self._users.get(uid))
+
+    def get_all_users(self):
+        return [self.pricing.price(user) for user in self._users.values()]
+
+    def _replace_user(self, uid, **changes):
+        # Swap in a new record so readers holding the old one keep a consistent snapshot
+        user = self._users.get(uid)
+        if user is not None:
+            self._users[uid] = user.replace(version=user.version + 1, **changes)
+            self._version += 1
+
+    def data_version(self):
+        return (self._version, self.pricing.current().version)
+
+    def revalue(self, chunk_size=50000, progress=None):
+        schedule = self.pricing.current()
+        uids = list(self._users)
+        changed = 0
+        for start in range(0, len(uids), chunk_size):
+            with self.lock:
+                for uid in uids[start:start + chunk_size]:
+                    user = self._users.get(uid)
+                    if user is None:
+                        continue
+                    resale_value = schedule.resale_value(user.amount_invested)
+                    if user.resale_value != resale_value:
+                        self._replace_user(uid, resale_value=resale_value)
+                        changed += 1
+            if progress is not None:
+                progress(min(start + chunk_size, len(uids)), len(uids), changed)
+        return changed
+
+    def update_certificate_type(self, uid, cert_type):
+        with self.lock:
+            self._replace_user(uid, certificate_type=cert_type)
+
+    def update_user_field(self, uid, field_name, new_value):
+        if field_name not in EDITABLE_FIELDS:
+            raise ValueError('Invalid field name')
+        with self.lock:
+            self._replace_user(uid, **{field_name: new_value})
+
+    def update_email(self, uid, new_email):
+        self._validate_email(new_email)
+        with self.lock:
+            self._replace_user(uid, email_hash=self._hash_data(new_email) if new_email else None)
+
+    def update_investment(self, uid, new_amount_invested, new_resale_value):
+        with self.lock:
+            self._replace_user(uid, amount_invested=new_amount_invested, resale_value=new_resale_value)
+
+    def delete_user(self, uid):
+        with self.lock:
+            self._users.pop(uid, None)
+            self._version += 1
+            for history in (self._transactions, self._transaction_keys, self._updates, self._archived_updates):
+                history.pop(uid, None)
+
+    def _check_delta(self, uid, delta, expected_version=None):
+        user = self._users.get(uid)
+        if user is None:
+            raise ValueError(f'User {uid} not found.')
+        if expected_version is not None and user.version != expected_version:
+            raise ConcurrencyError(f'User {uid} was modified by another session.')
+        if user.amount_invested + delta < 0:
+            raise ValueError('Transfer amount exceeds the current investment.')
+
+    def _apply_delta(self, uid, delta):
+        amount = self._users[uid].amount_invested + delta
+        self._replace_user(uid, amount_invested=amount, resale_value=self._resale_value(amount))
+
+    def change_investment(self, uid, delta, expected_version, transaction_type, details):
+        self._validate_amount(delta)
+        with self.lock:
+            self._check_delta(uid, delta, expected_version)
+            self._apply_delta(uid, delta)
+            self._insert_transaction(uid, transaction_type, delta, details)
+
+    def transfer(self, sender_uid, recipient_uid, amount, sender_version):
+        self._validate_transfer(sender_uid, recipient_uid, amount)
+        with self.lock:
+            # Check both sides before changing either, so a failure leaves no partial transfer
+            self._check_delta(sender_uid, -amount, sender_version)
+            self._check_delta(recipient_uid, amount)
+            self._apply_delta(sender_uid, -amount)
+            self._apply_delta(recipient_uid, amount)
+            self._insert_transaction(sender_uid, 'transfer_out', -amount, f'Transferred to UID {recipient_uid}')
+            self._insert_transaction(recipient_uid, 'transfer_in', amount, f'Received from UID {sender_uid}')
+        return COMMITTED
+
+    def _insert_transaction(self, uid, transaction_type, amount, details):
+        if uid not in self._users:
+            return
+        transaction = Transaction(next(self._ids), uid, datetime.now().isoformat(), transaction_type, amount, details)
+        key = (transaction.timestamp, transaction.id)
+        keys = self._transaction_keys[uid]
+        position = bisect.bisect(keys, key)
+        keys.insert(position, key)
+        self._transactions[uid].insert(position, transaction)
+
+    def add_transaction(self, uid, transaction_type, amount, details):
+        with self.lock:
+            self._insert_transaction(uid, transaction_type, amount, details)
+
+    def get_transactions(self, uid):
+        return list(self._transactions.get(uid, ()))
+
+    def get_transactions_page(self, uid, limit=20, cursor=None, transaction_type=None):
+        with self.lock:
+            transactions = self._transactions.get(uid, [])
+            # Walk backwards from the cursor, newest first
+            end = bisect.bisect_left(self._transaction_keys.get(uid, []), tuple(cursor)) if cursor else len(transactions)
+            page = []
+            for position in range(end - 1, -1, -1):
+                transaction = transactions[position]
+                if transaction_type and transaction.type != transaction_type:
+                    continue
+                page.append(transaction)
+                if len(page) > limit:
+                    break
+        next_cursor = (page[limit - 1].timestamp, page[limit - 1].id) if len(page) > limit else None
+        return page[:limit], next_cursor
+
+    def get_transaction_types(self, uid):
+        return sorted({transaction.type for transaction in self._transactions.get(uid, ())})
+
+    def add_update(self, uid, update_text):
+        with self.lock:
+            if uid in self._users:
+                self._updates[uid].append({'timestamp': datetime.now().isoformat(), 'update': update_text})
+
+    def get_updates(self, uid):
+        return list(self._updates.get(uid, ()))
+
+    def get_archived_updates(self, uid):
+        return list(self._archived_updates.get(uid, ()))
+
+    def archive_updates(self, keep_last=None, older_than_days=None, encoding='binary'):
+        # Archived updates stay as dicts in memory, so the encoding does not apply
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat() if older_than_days is not None else None
+        archived = 0
+        with self.lock:
+            for uid, updates in self._updates.items():
+                keep_from = max(0, len(updates) - keep_last) if keep_last is not None else 0
+                kept = []
+                for position, update in enumerate(updates):
+                    if position < keep_from or (cutoff and update['timestamp'] < cutoff):
+                        self._archived_updates[uid].append(update)
+                        archived += 1
+                    else:
+                        kept.append(update)
+                self._updates[uid] = kept
+        return archived
+
+    def get_idempotent_result(self, key):
+        entry = self._idempotency_keys.get(key)
+        if entry is None or entry[2] <= time.time():
+            return False, None
+        if entry[1] is _PENDING:
+            raise ActionPendingError(f'An earlier {entry[0]} with this key did not record its result.')
+        return True, entry[1]
+
+    def reserve_idempotency_key(self, key, action, ttl):
+        now = time.time()
+        with self.lock:
+            entry = self._idempotency_keys.get(key)
+            if entry is not None and entry[2] > now:
+                return False
+            self._idempotency_keys[key] = (action, _PENDING, now + ttl)
+            return True
+
+    def release_idempotency_key(self, key):
+        with self.lock:
+            entry = self._idempotency_keys.get(key)
+            if entry is not None and entry[1] is _PENDING:
+                del self._idempotency_keys[key]
+
+    def save_idempotent_result(self, key, action, result, ttl):
+        with self.lock:
+            self._idempotency_keys[key] = (action, result, time.time() + ttl)
+
+    def purge_idempotency_keys(self):
+        now = time.time()
+        with self.lock:
+            expired = [key for key, entry in self._idempotency_keys.items() if entry[2] <= now]
+            for key in expired:
+                del self._idempotency_keys[key]
+        return len(expired)
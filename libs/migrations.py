@@ -0,0 +1,388 @@
+# migrations.py
+"""
+Ordered schema migrations for users.db.
+
+Each migration runs once, in its own transaction, and is recorded in the
+`schema_version` table. New migrations are appended to MIGRATIONS with the
+next version number; applied ones are never edited. Migrations 1-5 bring
+databases created before versioning up to date, so every statement in them
+must be safe to run against a database that already has that schema.
+
+Usage:
+    python -m libs.migrations status [db/users.db]   show applied and pending migrations
+    python -m libs.migrations migrate [db/users.db]  apply pending migrations
+    python -m libs.migrations check [db/users.db]    flag full-table scans in DBWrapper queries
+"""
+
+import os
+import pathlib
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime
+
+import libs.history_codec as history_codec
+
+def _columns(cursor, table):
+    cursor.execute(f'PRAGMA table_info({table})')
+    return [column[1] for column in cursor.fetchall()]
+
+def _create_users(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            uid TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            phone_hash TEXT NOT NULL,
+            email_hash TEXT,
+            amount_invested INTEGER NOT NULL,
+            date_of_investment TEXT NOT NULL,
+            resale_value REAL,
+            certificate_type TEXT,
+            updates TEXT,
+            transactions TEXT,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # Row version for optimistic concurrency, bumped by every write to a user
+    if 'version' not in _columns(cursor, 'users'):
+        cursor.execute('ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+def _create_transactions(cursor):
+    # Transaction history lives in its own table so pages can be read by
+    # keyset (timestamp, id) without loading the whole history.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            uid TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            type TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            details TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_uid_ts ON transactions (uid, timestamp, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_uid_type_ts ON transactions (uid, type, timestamp, id)')
+
+    # Move histories still stored as a JSON array on the users row
+    cursor.execute("SELECT uid, transactions FROM users WHERE transactions IS NOT NULL AND transactions != '[]'")
+    for uid, data in cursor.fetchall():
+        cursor.executemany('''
+            INSERT INTO transactions (uid, timestamp, type, amount, details)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(uid, *record) for record in history_codec.decode(data)])
+    cursor.execute("UPDATE users SET transactions = NULL WHERE transactions IS NOT NULL")
+
+def _create_updates(cursor):
+    # Per-user updates, with an archive for entries outside the retention policy
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS updates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            uid TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            update_text TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_updates_uid ON updates (uid, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_updates_timestamp ON updates (timestamp)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS updates_archive (
+            id INTEGER PRIMARY KEY,
+            uid TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            update_text TEXT NOT NULL,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_updates_archive_uid ON updates_archive (uid, id)')
+
+    # Move updates still stored as a JSON array on the users row
+    cursor.execute("SELECT uid, updates FROM users WHERE updates IS NOT NULL AND updates != '[]'")
+    for uid, data in cursor.fetchall():
+        cursor.executemany('''
+            INSERT INTO updates (uid, timestamp, update_text) VALUES (?, ?, ?)
+        ''', [(uid, record[0], record[3]) for record in history_codec.decode(data)])
+    cursor.execute("UPDATE users SET updates = NULL WHERE updates IS NOT NULL")
+
+def _create_archive_batches(cursor):
+    # Archived updates are written in batches, one encoded payload per user per run
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS updates_archive_batches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            uid TEXT NOT NULL,
+            archived_at TEXT NOT NULL,
+            payload BLOB NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_updates_archive_batches_uid ON updates_archive_batches (uid, id)')
+
+def _create_idempotency_keys(cursor):
+    # Results of submitted actions by idempotency key, so a repeated submission is not redone
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            action TEXT NOT NULL,
+            result TEXT,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys (expires_at)')
+
+def _index_user_filters(cursor):
+    # Columns the admin panel filters and sorts users by
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_name ON users (name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_date ON users (date_of_investment)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_certificate_type ON users (certificate_type)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_amount ON users (amount_invested)')
+
+def _create_transfer_log(cursor):
+    # Transfers between shards (see libs/sharded_repository.py): the sender's
+    # shard logs each transfer with its debit, the recipient's shard records the credit
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transfer_log (
+            transfer_id TEXT PRIMARY KEY,
+            sender_uid TEXT NOT NULL,
+            recipient_uid TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            state TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transfer_log_state ON transfer_log (state, updated_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transfer_credits (
+            transfer_id TEXT PRIMARY KEY,
+            uid TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+
+def _track_user_changes(cursor):
+    # A counter bumped by every change to users, so a process can tell whether
+    # commits made by other connections touched users at all
+    cursor.execute('CREATE TABLE IF NOT EXISTS users_changes (id INTEGER PRIMARY KEY CHECK (id = 1), changes INTEGER NOT NULL)')
+    cursor.execute('INSERT OR IGNORE INTO users_changes (id, changes) VALUES (1, 0)')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS users_changes_{event.lower()} AFTER {event} ON users
+            BEGIN UPDATE users_changes SET changes = changes + 1 WHERE id = 1; END
+        ''')
+
+def _drop_user_filter_indexes(cursor):
+    # The admin panel filters the in-memory user snapshot, so the indexes from
+    # migration 6 only slowed down every write to users
+    for index in ('idx_users_name', 'idx_users_date', 'idx_users_certificate_type', 'idx_users_amount'):
+        cursor.execute(f'DROP INDEX IF EXISTS {index}')
+
+def _index_transfer_senders(cursor):
+    # delete_user removes the user's closed transfers by sender
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transfer_log_sender ON transfer_log (sender_uid)')
+
+# (version, description, function applied with a cursor inside the migration's transaction)
+MIGRATIONS = [
+    (1, 'users table with row versions', _create_users),
+    (2, 'transactions table, moved out of users.transactions', _create_transactions),
+    (3, 'updates and archive tables, moved out of users.updates', _create_updates),
+    (4, 'batched, encoded update archive', _create_archive_batches),
+    (5, 'idempotency keys', _create_idempotency_keys),
+    (6, 'indexes for the admin user filters', _index_user_filters),
+    (7, 'cross-shard transfer log', _create_transfer_log),
+    (8, 'users change counter', _track_user_changes),
+    (9, 'drop the unused admin filter indexes', _drop_user_filter_indexes),
+    (10, 'transfer log index by sender', _index_transfer_senders),
+]
+
+def _ensure_version_table(connection):
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+    connection.commit()
+
+def applied_versions(connection):
+    """
+    Read the applied migration versions, without writing anything.
+
+    Returns:
+        set: Applied versions, or None if the database has no schema_version table yet.
+    """
+    exists = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone()
+    if exists is None:
+        return None
+    return {row[0] for row in connection.execute('SELECT version FROM schema_version')}
+
+def migrate(connection):
+    """
+    Apply pending migrations in order, then ANALYZE if anything changed.
+
+    Safe to run from several connections at once: each migration takes the
+    write lock (BEGIN IMMEDIATE) and re-checks whether it was applied.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the database.
+
+    Returns:
+        list: Versions applied by this call.
+    """
+    _ensure_version_table(connection)
+    done = applied_versions(connection)
+    pending = [migration for migration in MIGRATIONS if migration[0] not in done]
+    applied = []
+    cursor = connection.cursor()
+    for version, description, apply in pending:
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,))
+            if cursor.fetchone() is None:
+                apply(cursor)
+                cursor.execute(
+                    'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                    (version, description, datetime.now().isoformat())
+                )
+                applied.append(version)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    if applied:
+        # Refresh planner statistics for the new schema
+        cursor.execute('ANALYZE')
+        connection.commit()
+    return applied
+
+# Query plan check
+
+# Full scans that are deliberate, matched against the start of the statement
+EXPECTED_SCANS = {
+    'SELECT uid, name, phone_hash': 'get_all_users loads every user for the snapshot',
+    'SELECT id, payload FROM updates_archive_batches WHERE typeof(payload)': 're-encoding checks every batch',
+}
+
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|REPLACE)\b', re.IGNORECASE)
+# Scans of a constant row or of a temp table built for the statement are fine
+_FULL_SCAN = re.compile(r'\bSCAN (?!CONSTANT ROW|temp\.)(\w+)\b(?! USING (COVERING )?INDEX)')
+
+def _exercise(db_wrapper):
+    # Call every DBWrapper method that runs SQL, on throwaway users
+    uid, other_uid = 'PLANCHECK1', 'PLANCHECK2'
+    for user_id in (uid, other_uid):
+        db_wrapper.add_user(user_id, 'Plan Check', '0000000000', 1000, '2024-01-01 00:00:00', None, 960)
+    db_wrapper.get_user_by_uid(uid)
+    db_wrapper.get_all_users()
+    db_wrapper.update_certificate_type(uid, 'Small Card (₹40)')
+    db_wrapper.update_user_field(uid, 'name', 'Plan Check')
+    db_wrapper.update_email(uid, 'plan@example.com')
+    db_wrapper.update_investment(uid, 1000, 960)
+    db_wrapper.add_transaction(uid, 'verification', 0, 'Plan check')
+    db_wrapper.change_investment(uid, 500, db_wrapper.get_user_by_uid(uid).version, 'reinvestment', 'Plan check')
+    db_wrapper.transfer(uid, other_uid, 500, db_wrapper.get_user_by_uid(uid).version)
+    db_wrapper.debit_transfer('plan-check', uid, other_uid, 500, db_wrapper.get_user_by_uid(uid).version)
+    db_wrapper.credit_transfer('plan-check', uid, other_uid, 500)
+    db_wrapper.finish_transfer('plan-check')
+    db_wrapper.get_open_transfers()
+    db_wrapper.get_transactions(uid)
+    page, cursor = db_wrapper.get_transactions_page(uid, limit=1)
+    db_wrapper.get_transactions_page(uid, limit=1, cursor=cursor or ('9999', 0), transaction_type='reinvestment')
+    db_wrapper.get_transaction_types(uid)
+    for _ in range(3):
+        db_wrapper.add_update(uid, 'Plan check')
+    db_wrapper.get_updates(uid)
+    db_wrapper.archive_updates(keep_last=1, older_than_days=365)
+    db_wrapper.pack_archived_updates()
+    db_wrapper.get_archived_updates(uid)
+    db_wrapper.revalue()
+    db_wrapper.run_idempotent('plan-check', 'check', lambda: {'ok': True}, 60)
+    db_wrapper.purge_idempotency_keys()
+    db_wrapper.data_version()
+    for user_id in (uid, other_uid):
+        db_wrapper.delete_user(user_id)
+
+def check_query_plans(db_path):
+    """
+    Run every DBWrapper query against a scratch copy of the database and
+    report the ones whose EXPLAIN QUERY PLAN contains a full-table scan.
+
+    Returns:
+        list: (statement, scanned tables, reason if the scan is expected) per flagged statement.
+    """
+    # Imported here: db_con itself runs the migrations
+    import libs.db_con as db_con
+
+    workdir = tempfile.mkdtemp(prefix='plan_check_')
+    try:
+        scratch_path = os.path.join(workdir, 'users.db')
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(scratch_path)
+        source.backup(target)
+        target.close()
+        source.close()
+
+        statements = []
+        db_wrapper = db_con.DBWrapper(scratch_path, cache_size=0, read_pool_size=1)
+        db_wrapper.set_trace_callback(statements.append)
+        _exercise(db_wrapper)
+        db_wrapper.set_trace_callback(None)
+        db_wrapper.close()
+
+        connection = sqlite3.connect(scratch_path)
+        # Temp tables only exist on the connection that made them
+        connection.execute('CREATE TEMP TABLE IF NOT EXISTS expired_updates (id INTEGER)')
+        flagged = []
+        seen = set()
+        for statement in statements:
+            # Bound values were expanded into the text; group by the statement's shape
+            shape = re.sub(r"'[^']*'|\b\d+(\.\d+)?\b", '?', ' '.join(statement.split()))
+            if shape in seen or not _EXPLAINABLE.match(statement.replace('CREATE TEMP TABLE expired_updates AS', '')):
+                continue
+            seen.add(shape)
+            explained = statement.replace('CREATE TEMP TABLE expired_updates AS', '', 1)
+            plan = connection.execute('EXPLAIN QUERY PLAN ' + explained).fetchall()
+            tables = sorted({match.group(1) for row in plan for match in _FULL_SCAN.finditer(row[3])})
+            if tables:
+                reason = next((why for prefix, why in EXPECTED_SCANS.items() if shape.startswith(prefix)), None)
+                flagged.append((shape, tables, reason))
+        connection.close()
+        return flagged
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    path = sys.argv[2] if len(sys.argv) > 2 else 'db/users.db'
+    if command == 'status':
+        if not os.path.exists(path):
+            print(f"{path} does not exist")
+            sys.exit(1)
+        # Read-only, so checking a database never creates or changes it
+        connection = sqlite3.connect(pathlib.Path(path).absolute().as_uri() + '?mode=ro', uri=True)
+        applied = applied_versions(connection)
+        if applied is None:
+            print(f"{path} is unversioned: no schema_version table")
+            applied = set()
+        for version, description, _ in MIGRATIONS:
+            print(f"{version:3d}  {'applied' if version in applied else 'pending':8s} {description}")
+        connection.close()
+    elif command == 'migrate':
+        connection = sqlite3.connect(path)
+        print(f"Applied migrations: {migrate(connection) or 'none'}")
+        connection.close()
+    elif command == 'check':
+        flagged = check_query_plans(path)
+        unexpected = [entry for entry in flagged if entry[2] is None]
+        for shape, tables, reason in flagged:
+            print(f"{'expected' if reason else 'SCAN':8s} {', '.join(tables)}: {shape[:100]}")
+            if reason:
+                print(f"         ({reason})")
+        print(f"{len(unexpected)} unexpected full-table scans")
+        sys.exit(1 if unexpected else 0)
+    else:
+        print(__doc__)
+        sys.exit(1)
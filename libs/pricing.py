@@ -0,0 +1,133 @@
+# pricing.py
+
+import bisect
+from datetime import date, datetime
+
+from libs.config import load_config
+from libs.repository import SHARE_PRICE
+
+MODES = ('stored', 'computed')
+
+def _as_date(value):
+    # YAML gives dates as date objects, other callers may pass ISO strings
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+class PriceSchedule:
+    """Resale price of a profit share from `effective_from` until the next schedule"""
+
+    __slots__ = ('version', 'effective_from', 'resale_value_per_share')
+
+    def __init__(self, version, effective_from, resale_value_per_share):
+        self.version = version
+        self.effective_from = _as_date(effective_from)
+        self.resale_value_per_share = resale_value_per_share
+
+    def resale_value(self, amount_invested):
+        return self.resale_value_per_share * (amount_invested // SHARE_PRICE)
+
+    def __repr__(self):
+        return (f"PriceSchedule(version={self.version!r}, effective_from={self.effective_from.isoformat()!r}, "
+                f"resale_value_per_share={self.resale_value_per_share!r})")
+
+DEFAULT_SCHEDULES = (PriceSchedule(1, '2024-01-01', 480),)
+
+class PricingEngine:
+    """
+    Computes resale values from versioned price schedules.
+
+    In 'stored' mode the users.resale_value column is authoritative and is
+    brought up to date by a batch revaluation (Repository.revalue). In
+    'computed' mode repositories derive resale values from the current
+    schedule whenever users are read.
+    """
+
+    def __init__(self, schedules=None, mode='stored'):
+        """
+        Initializes the engine.
+
+        Args:
+            schedules (list): PriceSchedule objects; defaults to DEFAULT_SCHEDULES.
+            mode (str): 'stored' or 'computed'.
+        """
+        if mode not in MODES:
+            raise ValueError(f'Pricing mode must be one of {", ".join(MODES)}.')
+        schedules = sorted(schedules or DEFAULT_SCHEDULES, key=lambda schedule: schedule.effective_from)
+        versions = [schedule.version for schedule in schedules]
+        if len(set(versions)) != len(versions):
+            raise ValueError('Price schedule versions must be unique.')
+        self.schedules = schedules
+        self.mode = mode
+        self._starts = [schedule.effective_from for schedule in schedules]
+
+    @classmethod
+    def from_config(cls, config=None):
+        """Build an engine from the `pricing` config section"""
+        config = load_config() if config is None else config
+        pricing = config.get('pricing', {})
+        schedules = [
+            PriceSchedule(entry['version'], entry['effective_from'], entry['resale_value_per_share'])
+            for entry in pricing.get('schedules', [])
+        ]
+        return cls(schedules, pricing.get('mode', 'stored'))
+
+    @property
+    def computed(self):
+        return self.mode == 'computed'
+
+    def schedule_at(self, when=None):
+        """
+        Return the schedule in effect on a date.
+
+        Args:
+            when (date): The date; defaults to today.
+
+        Returns:
+            PriceSchedule: The latest schedule starting on or before `when`,
+            or the earliest schedule if none has started yet.
+        """
+        when = date.today() if when is None else _as_date(when)
+        position = bisect.bisect_right(self._starts, when)
+        return self.schedules[max(position - 1, 0)]
+
+    def current(self):
+        return self.schedule_at()
+
+    def resale_value(self, amount_invested, when=None):
+        return self.schedule_at(when).resale_value(amount_invested)
+
+    def price(self, user):
+        """Return `user` with its resale value computed in 'computed' mode, unchanged otherwise"""
+        if user is None or not self.computed:
+            return user
+        resale_value = self.current().resale_value(user.amount_invested)
+        if resale_value == user.resale_value:
+            return user
+        return user.replace(resale_value=resale_value)
+
+if __name__ == "__main__":
+    # Revalue every stored resale value with the current schedule: python -m libs.pricing [db/users.db]
+    # Without a path this revalues the configured storage, all shards included
+    import sys
+    import time
+    import libs.db_con as db_con
+    from libs.sharded_repository import open_repository
+
+    if len(sys.argv) > 1:
+        db_wrapper = db_con.DBWrapper(sys.argv[1], pricing=PricingEngine.from_config())
+    else:
+        db_wrapper = open_repository(read_pool_size=1)
+    schedule = db_wrapper.pricing.current()
+    print(f"Revaluing with schedule v{schedule.version} (₹{schedule.resale_value_per_share} per share)")
+
+    def report(done, total, changed):
+        print(f"  {done}/{total} users scanned, {changed} updated", flush=True)
+
+    started = time.perf_counter()
+    changed = db_wrapper.revalue(progress=report)
+    seconds = time.perf_counter() - started
+    print(f"Updated {changed} resale values in {seconds:.2f}s")
+    db_wrapper.close()
@@ -0,0 +1,101 @@
+# rate_limit.py
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+class TokenBucket:
+    """Token bucket that refills continuously up to its capacity"""
+
+    def __init__(self, capacity, refill_rate):
+        """
+        Initializes a full bucket.
+
+        Args:
+            capacity (float): Maximum number of tokens (the allowed burst).
+            refill_rate (float): Tokens added per second.
+        """
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # Rejections since a token was last acquired
+        self.rejected = 0
+
+    def try_acquire(self, tokens=1):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+class RateLimiter:
+    """Per-key token buckets, keeping at most `max_keys` of the most recently used"""
+
+    def __init__(self, capacity, refill_rate, max_keys=10000):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def allow(self, key):
+        return self.acquire(key)[0]
+
+    def acquire(self, key):
+        """
+        Take a token from the bucket of `key` if one is available.
+
+        Returns:
+            tuple: (allowed, skipped); when allowed, skipped is the number of
+            calls for `key` rejected since its last allowed one.
+        """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.capacity, self.refill_rate)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            if bucket.try_acquire():
+                self.allowed += 1
+                skipped, bucket.rejected = bucket.rejected, 0
+                return True, skipped
+            self.rejected += 1
+            bucket.rejected += 1
+            return False, 0
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into a single execution"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run `fn` unless a call for `key` is already in flight, in which case
+        wait for that call and share its result (or exception).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result()
+
+        try:
+            call.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            call.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return call.result()
@@ -0,0 +1,56 @@
+# records.py
+
+class User:
+    """A row of the users table"""
+
+    __slots__ = ('uid', 'name', 'phone_hash', 'email_hash', 'amount_invested',
+                 'date_of_investment', 'resale_value', 'certificate_type', 'version')
+
+    def __init__(self, uid, name, phone_hash, email_hash, amount_invested,
+                 date_of_investment, resale_value=None, certificate_type=None, version=0):
+        self.uid = uid
+        self.name = name
+        self.phone_hash = phone_hash
+        self.email_hash = email_hash
+        self.amount_invested = amount_invested
+        self.date_of_investment = date_of_investment
+        self.resale_value = resale_value
+        self.certificate_type = certificate_type
+        self.version = version
+
+    def astuple(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def replace(self, **changes):
+        """Return a copy with some fields changed; records are not modified in place"""
+        values = {field: getattr(self, field) for field in self.__slots__}
+        values.update(changes)
+        return type(self)(**values)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other.astuple() == self.astuple()
+
+    def __repr__(self):
+        return f"User(uid={self.uid!r}, name={self.name!r}, amount_invested={self.amount_invested!r}, version={self.version!r})"
+
+class Transaction:
+    """An entry of a user's transaction history"""
+
+    __slots__ = ('id', 'uid', 'timestamp', 'type', 'amount', 'details')
+
+    def __init__(self, id, uid, timestamp, type, amount, details):
+        self.id = id
+        self.uid = uid
+        self.timestamp = timestamp
+        self.type = type
+        self.amount = amount
+        self.details = details
+
+    def astuple(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other.astuple() == self.astuple()
+
+    def __repr__(self):
+        return f"Transaction(id={self.id!r}, uid={self.uid!r}, type={self.type!r}, amount={self.amount!r})"
@@ -0,0 +1,255 @@
+# repository.py
+
+import hashlib
+import re
+from abc import ABC, abstractmethod
+
+SHARE_PRICE = 500
+
+# Fields an admin may change through update_user_field
+EDITABLE_FIELDS = ('name', 'phone_hash', 'email_hash', 'amount_invested', 'date_of_investment', 'resale_value', 'certificate_type')
+
+# Outcomes of a transfer; also the states of a cross-shard transfer in the sender shard's log
+DEBITED = 'debited'      # sender debited; the recipient will be credited by a later `recover`
+COMMITTED = 'committed'
+REFUNDED = 'refunded'    # recipient was deleted before the credit; sender refunded
+
+class ConcurrencyError(Exception):
+    """Raised when a user row changed since it was read. Reload the user and retry."""
+
+class ActionPendingError(Exception):
+    """Raised when an earlier run of an idempotent action started but its result was never recorded."""
+
+class DuplicateUserError(ValueError):
+    """Raised when adding a user whose UID is already taken."""
+
+class Repository(ABC):
+    """
+    Storage interface used by the pages and the admin panel.
+
+    Users are returned as `User` records and transaction history as
+    `Transaction` records (see libs/records.py). Records are never changed
+    in place, so a record held in session state stays a consistent snapshot.
+    Resale values come from the `pricing` engine (see libs/pricing.py).
+    """
+
+    # Users
+
+    @abstractmethod
+    def add_user(self, uid, name, phone_number, amount_invested, date_of_investment, email=None, resale_value=None):
+        """
+        Raises:
+            DuplicateUserError: If a user with `uid` already exists.
+        """
+
+    @abstractmethod
+    def get_user_by_uid(self, uid, cached=True):
+        """
+        Return the User with this UID, or None.
+
+        Pass cached=False for reads a write will be based on (its version or
+        balance), so they never come from a cache.
+        """
+
+    @abstractmethod
+    def get_all_users(self):
+        """Return a list of all Users."""
+
+    @abstractmethod
+    def update_certificate_type(self, uid, cert_type):
+        pass
+
+    @abstractmethod
+    def update_user_field(self, uid, field_name, new_value):
+        pass
+
+    @abstractmethod
+    def update_email(self, uid, new_email):
+        pass
+
+    @abstractmethod
+    def update_investment(self, uid, new_amount_invested, new_resale_value):
+        pass
+
+    @abstractmethod
+    def delete_user(self, uid):
+        pass
+
+    # Balance changes
+
+    @abstractmethod
+    def change_investment(self, uid, delta, expected_version, transaction_type, details):
+        """
+        Add `delta` to a user's investment and log it, if the user is still at `expected_version`.
+
+        Raises:
+            ConcurrencyError: If the user was modified since `expected_version` was read.
+        """
+
+    @abstractmethod
+    def transfer(self, sender_uid, recipient_uid, amount, sender_version):
+        """
+        Move `amount` from sender to recipient atomically, logging both sides.
+
+        Returns:
+            str: COMMITTED, or for a transfer between shards REFUNDED (the
+            recipient was deleted meanwhile) or DEBITED (still to be credited).
+
+        Raises:
+            ConcurrencyError: If the sender was modified since `sender_version` was read.
+        """
+
+    # Transaction history
+
+    @abstractmethod
+    def add_transaction(self, uid, transaction_type, amount, details):
+        pass
+
+    @abstractmethod
+    def get_transactions(self, uid):
+        """Return all of a user's Transactions, oldest first."""
+
+    @abstractmethod
+    def get_transactions_page(self, uid, limit=20, cursor=None, transaction_type=None):
+        """Return (transactions, next_cursor) for one page, newest first."""
+
+    @abstractmethod
+    def get_transaction_types(self, uid):
+        pass
+
+    # Updates log
+
+    @abstractmethod
+    def add_update(self, uid, update_text):
+        pass
+
+    @abstractmethod
+    def get_updates(self, uid):
+        pass
+
+    @abstractmethod
+    def get_archived_updates(self, uid):
+        pass
+
+    @abstractmethod
+    def archive_updates(self, keep_last=None, older_than_days=None, encoding='binary'):
+        """Move updates outside the retention policy to the archive; returns how many moved."""
+
+    # Pricing
+
+    @abstractmethod
+    def revalue(self, chunk_size=50000, progress=None):
+        """
+        Recompute stored resale values with the current price schedule.
+
+        Returns:
+            int: Number of users whose resale value changed.
+        """
+
+    # Idempotency keys
+
+    @abstractmethod
+    def get_idempotent_result(self, key):
+        """
+        Return (True, result) if `key` was recorded and hasn't expired, else (False, None).
+
+        Raises:
+            ActionPendingError: If `key` is reserved but has no result yet.
+        """
+
+    @abstractmethod
+    def reserve_idempotency_key(self, key, action, ttl):
+        """Mark `key` as in progress for `ttl` seconds; False if it is already taken."""
+
+    @abstractmethod
+    def release_idempotency_key(self, key):
+        """Drop the reservation of `key` if no result was recorded for it."""
+
+    @abstractmethod
+    def save_idempotent_result(self, key, action, result, ttl):
+        """Record the JSON-serializable `result` of `action` under `key` for `ttl` seconds."""
+
+    @abstractmethod
+    def purge_idempotency_keys(self):
+        """Delete expired keys; returns how many were deleted."""
+
+    def run_idempotent(self, key, action, fn, ttl=86400):
+        """
+        Run `fn` once per key: a repeated key returns the recorded result instead.
+
+        The key is reserved before `fn` runs. If the process dies or the result
+        can't be saved after `fn` committed, a retry finds the reservation and
+        raises instead of running `fn` a second time. `fn` must be all or
+        nothing: if it raises, the reservation is dropped and the key can be
+        retried. Callers must not run two calls with the same key
+        concurrently; the app runs them on its single writer thread.
+
+        Args:
+            key (str): Idempotency key of the submission.
+            action (str): Name of the action, stored for auditing.
+            fn (callable): Performs the action and returns a JSON-serializable result.
+            ttl (int): Seconds to remember the result.
+
+        Returns:
+            tuple: (result, replayed); replayed is True if the stored result was returned.
+
+        Raises:
+            ActionPendingError: If an earlier run with this key may have done the action.
+        """
+        found, result = self.get_idempotent_result(key)
+        if found:
+            return result, True
+        if not self.reserve_idempotency_key(key, action, ttl):
+            raise ActionPendingError(f'Action {action} with this key is already in progress.')
+        try:
+            result = fn()
+        except Exception:
+            self.release_idempotency_key(key)
+            raise
+        self.save_idempotent_result(key, action, result, ttl)
+        return result, False
+
+    # Maintenance
+
+    def data_version(self):
+        """Token that changes whenever users may have changed; None if unknown."""
+        return None
+
+    def compact(self, free_ratio=0.0):
+        """Reclaim free space if at least `free_ratio` of the storage is unused; returns whether it did."""
+        return False
+
+    def recover(self):
+        """Finish or roll back writes a crash left half done; returns how many were resolved."""
+        return 0
+
+    def cache_stats(self):
+        return None
+
+    def close(self):
+        pass
+
+    # Helpers shared by implementations
+
+    def _hash_data(self, data):
+        return hashlib.sha256(str(data).encode('utf-8')).hexdigest()
+
+    def _validate_email(self, email):
+        if email:
+            pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+            if not re.match(pattern, email):
+                raise ValueError('Invalid email format')
+        return True
+
+    def _validate_amount(self, amount):
+        if amount % SHARE_PRICE != 0:
+            raise ValueError(f'Amount must be in multiples of {SHARE_PRICE}.')
+
+    def _validate_transfer(self, sender_uid, recipient_uid, amount):
+        if amount <= 0 or amount % SHARE_PRICE != 0:
+            raise ValueError(f'Transfer amount must be a positive multiple of {SHARE_PRICE}.')
+        if sender_uid == recipient_uid:
+            raise ValueError('Cannot transfer to the same user.')
+
+    def _resale_value(self, amount_invested):
+        return self.pricing.resale_value(amount_invested)
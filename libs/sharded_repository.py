@@ -0,0 +1,460 @@
+# sharded_repository.py
+"""
+Users partitioned by a hash of the UID across several SQLite files.
+
+Every shard is a full DBWrapper database with its own write connection, so
+app replicas writing to different shards never wait on the same file lock.
+A user's transactions, updates and archive live in the user's shard.
+
+Transfers between users on different shards can't be one SQLite
+transaction, so they run in two phases. The sender's shard debits the
+sender and logs the transfer in its `transfer_log` in one transaction; the
+recipient's shard then credits the recipient together with a
+`transfer_credits` marker, and the log entry is closed. A logged transfer
+is never undone, only completed: after a crash `recover` finds entries
+still open and credits each one (at most once, thanks to the marker), or
+refunds the sender if the recipient was deleted meanwhile.
+
+Usage:
+    python -m libs.sharded_repository status                 users per shard and open transfers
+    python -m libs.sharded_repository import [db/users.db]   copy a single-file database into empty shards
+    python -m libs.sharded_repository recover                complete interrupted transfers
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import libs.db_con as db_con
+import libs.migrations as migrations
+from libs.config import load_config
+from libs.pricing import PricingEngine
+from libs.repository import Repository, DEBITED, COMMITTED, REFUNDED
+
+logger = logging.getLogger(__name__)
+
+# Columns copied by `import_database`, per table
+IMPORT_TABLES = {
+    'users': db_con.USER_COLUMNS,
+    'transactions': 'id, uid, timestamp, type, amount, details',
+    'updates': 'id, uid, timestamp, update_text',
+    'updates_archive': 'id, uid, timestamp, update_text, archived_at',
+    'updates_archive_batches': 'id, uid, archived_at, payload',
+}
+
+def shard_index(key, shard_count):
+    """Stable shard of a UID or idempotency key; the same in every process"""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shard_count
+
+def shard_path(directory, index):
+    """File of shard `index` in a shard directory"""
+    return os.path.join(directory, f'users-{index}.db')
+
+class ShardedRepository(Repository):
+    """SQLite storage split across `shard_count` files by a hash of the UID"""
+
+    def __init__(self, directory='db/shards', shard_count=4, cache_size=1024, cache_ttl=300, negative_cache_ttl=30,
+                 pricing=None, read_pool_size=4, recovery_grace=60, cache_check_interval=0.5):
+        """
+        Opens (or creates) the shards.
+
+        Args:
+            directory (str): Directory holding the `users-<n>.db` shards.
+            shard_count (int): Number of shards; fixed once the directory is created.
+            cache_size (int): User cache entries, split evenly across the shards.
+            cache_ttl (int): Seconds a cached user is kept.
+            negative_cache_ttl (int): Seconds a UID that was not found is remembered.
+            pricing (PricingEngine): Price schedules shared by all shards.
+            read_pool_size (int): Read-only connections per shard.
+            recovery_grace (float): Seconds a transfer may stay open before `recover`
+                treats it as interrupted.
+            cache_check_interval (float): Seconds between checks for users
+                changed by other processes.
+        """
+        if shard_count < 1:
+            raise ValueError('shard_count must be at least 1.')
+        self.directory = directory
+        self.shard_count = shard_count
+        self.pricing = pricing or PricingEngine()
+        self.recovery_grace = recovery_grace
+        self.shards = [
+            db_con.DBWrapper(
+                shard_path(directory, index),
+                cache_size=max(cache_size // shard_count, 1),
+                cache_ttl=cache_ttl,
+                negative_cache_ttl=negative_cache_ttl,
+                pricing=self.pricing,
+                read_pool_size=read_pool_size,
+                cache_check_interval=cache_check_interval,
+            )
+            for index in range(shard_count)
+        ]
+        # Admin queries and maintenance run on every shard at once
+        self._executor = ThreadPoolExecutor(max_workers=shard_count, thread_name_prefix='shard')
+        self._cache = None
+        self._cache_version = None
+        self._cache_lock = threading.Lock()
+        try:
+            self._check_layout()
+        except ValueError:
+            self.close()
+            raise
+        self.recover()
+
+    @classmethod
+    def from_config(cls, config=None, **overrides):
+        """Build a repository from the `database`, `cache` and `pricing` config sections"""
+        config = load_config() if config is None else config
+        database = config.get('database', {})
+        cache_config = config.get('cache', {})
+        settings = {
+            'directory': database.get('shard_directory', 'db/shards'),
+            'shard_count': database.get('shards', 1),
+            'cache_size': cache_config.get('size', 1024),
+            'cache_ttl': cache_config.get('ttl', 300),
+            'negative_cache_ttl': cache_config.get('negative_ttl', 30),
+        'cache_check_interval': cache_config.get('check_interval', 0.5),
+            'cache_check_interval': cache_config.get('check_interval', 0.5),
+            'pricing': PricingEngine.from_config(config),
+            'read_pool_size': database.get('read_pool_size', 4),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def _check_layout(self):
+        # The shard count is part of the layout: another count would look up users in the wrong files
+        for index, shard in enumerate(self.shards):
+            with shard.lock:
+                shard.cursor.execute('CREATE TABLE IF NOT EXISTS shard_layout (shard_index INTEGER, shard_count INTEGER)')
+                shard.cursor.execute('SELECT shard_index, shard_count FROM shard_layout')
+                row = shard.cursor.fetchone()
+                if row is None:
+                    shard.cursor.execute('INSERT INTO shard_layout (shard_index, shard_count) VALUES (?, ?)',
+                                         (index, self.shard_count))
+                shard.connection.commit()
+            if row is not None and tuple(row) != (index, self.shard_count):
+                raise ValueError(f'{shard.db_path} is shard {row[0]} of {row[1]}, not {index} of {self.shard_count}.')
+
+    def shard(self, key):
+        """Return the shard holding a UID or idempotency key"""
+        return self.shards[shard_index(key, self.shard_count)]
+
+    def _fan_out(self, fn):
+        return list(self._executor.map(fn, self.shards))
+
+    # Users
+
+    def add_user(self, uid, name, phone_number, amount_invested, date_of_investment, email=None, resale_value=None):
+        self.shard(uid).add_user(uid, name, phone_number, amount_invested, date_of_investment, email, resale_value)
+
+    def get_user_by_uid(self, uid, cached=True):
+        return self.shard(uid).get_user_by_uid(uid, cached)
+
+    def get_all_users(self):
+        with self._cache_lock:
+            version = self.data_version()
+            if self._cache is None or self._cache_version != version:
+                users = []
+                for shard_users in self._fan_out(lambda shard: shard.get_all_users()):
+                    users.extend(shard_users)
+                self._cache = users
+                self._cache_version = version
+            return self._cache
+
+    def update_certificate_type(self, uid, cert_type):
+        self.shard(uid).update_certificate_type(uid, cert_type)
+
+    def update_user_field(self, uid, field_name, new_value):
+        self.shard(uid).update_user_field(uid, field_name, new_value)
+
+    def update_email(self, uid, new_email):
+        self.shard(uid).update_email(uid, new_email)
+
+    def update_investment(self, uid, new_amount_invested, new_resale_value):
+        self.shard(uid).update_investment(uid, new_amount_invested, new_resale_value)
+
+    def delete_user(self, uid):
+        self.shard(uid).delete_user(uid)
+
+    # Balance changes
+
+    def change_investment(self, uid, delta, expected_version, transaction_type, details):
+        self.shard(uid).change_investment(uid, delta, expected_version, transaction_type, details)
+
+    def transfer(self, sender_uid, recipient_uid, amount, sender_version):
+        """
+        Move `amount` from sender to recipient.
+
+        Within one shard this is a single database transaction. Across shards
+        the sender is debited first; from then on the transfer always
+        completes, here or in a later `recover`.
+
+        Returns:
+            str: COMMITTED; REFUNDED if the recipient was deleted before the
+            credit; DEBITED if the credit failed and is left to `recover`.
+
+        Raises:
+            ConcurrencyError: If the sender was modified since `sender_version` was read.
+        """
+        self._validate_transfer(sender_uid, recipient_uid, amount)
+        sender, recipient = self.shard(sender_uid), self.shard(recipient_uid)
+        if sender is recipient:
+            return sender.transfer(sender_uid, recipient_uid, amount, sender_version)
+        if recipient.get_user_by_uid(recipient_uid, cached=False) is None:
+            raise ValueError(f'User {recipient_uid} not found.')
+
+        # Phase 1: debit the sender and log the transfer, atomically in the sender's shard
+        transfer_id = uuid.uuid4().hex
+        sender.debit_transfer(transfer_id, sender_uid, recipient_uid, amount, sender_version)
+        # Phase 2: credit the recipient. The sender has paid, so the transfer has
+        # not failed whatever happens from here; recover() finishes what is left.
+        try:
+            refund = not self._credit(transfer_id, sender_uid, recipient_uid, amount)
+        except sqlite3.Error as e:
+            logger.warning("Transfer %s debited but not yet credited: %s", transfer_id, e)
+            return DEBITED
+        # Phase 3: close the log entry, refunding the sender if there was no one to credit
+        try:
+            sender.finish_transfer(transfer_id, refund)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning("Transfer %s not yet closed: %s", transfer_id, e)
+            if refund:
+                return DEBITED
+        return REFUNDED if refund else COMMITTED
+
+    def _credit(self, transfer_id, sender_uid, recipient_uid, amount):
+        # False if the recipient was deleted after the transfer started, so the sender gets a refund
+        try:
+            self.shard(recipient_uid).credit_transfer(transfer_id, sender_uid, recipient_uid, amount)
+            return True
+        except ValueError:
+            return False
+
+    def _complete(self, transfer_id, sender_uid, recipient_uid, amount):
+        # Phases 2 and 3 of a debited transfer; every step is safe to repeat
+        refund = not self._credit(transfer_id, sender_uid, recipient_uid, amount)
+        self.shard(sender_uid).finish_transfer(transfer_id, refund)
+        return REFUNDED if refund else COMMITTED
+
+    def recover(self, idle_seconds=None):
+        """
+        Complete cross-shard transfers a crash left debited but not credited.
+
+        Args:
+            idle_seconds (float): Only touch transfers open this long; defaults
+                to `recovery_grace`, which leaves transfers another replica is
+                still completing alone.
+
+        Returns:
+            int: Number of transfers completed.
+        """
+        idle_seconds = self.recovery_grace if idle_seconds is None else idle_seconds
+
+        def recover_shard(shard):
+            resolved = 0
+            for transfer_id, sender_uid, recipient_uid, amount in shard.get_open_transfers(idle_seconds):
+                try:
+                    state = self._complete(transfer_id, sender_uid, recipient_uid, amount)
+                    logger.info("Recovered transfer %s: %s", transfer_id, state)
+                    resolved += 1
+                except (sqlite3.Error, ValueError) as e:
+                    # E.g. a refund to a sender deleted meanwhile; left open for the next run
+                    logger.warning("Could not recover transfer %s: %s", transfer_id, e)
+            return resolved
+
+        return sum(self._fan_out(recover_shard))
+
+    def open_transfers(self):
+        """Return (transfer_id, sender_uid, recipient_uid, amount) of every debited, unfinished transfer"""
+        transfers = []
+        for shard_transfers in self._fan_out(lambda shard: shard.get_open_transfers()):
+            transfers.extend(shard_transfers)
+        return transfers
+
+    # Transaction history
+
+    def add_transaction(self, uid, transaction_type, amount, details):
+        self.shard(uid).add_transaction(uid, transaction_type, amount, details)
+
+    def get_transactions(self, uid):
+        return self.shard(uid).get_transactions(uid)
+
+    def get_transactions_page(self, uid, limit=20, cursor=None, transaction_type=None):
+        return self.shard(uid).get_transactions_page(uid, limit, cursor, transaction_type)
+
+    def get_transaction_types(self, uid):
+        return self.shard(uid).get_transaction_types(uid)
+
+    # Updates log
+
+    def add_update(self, uid, update_text):
+        self.shard(uid).add_update(uid, update_text)
+
+    def get_updates(self, uid):
+        return self.shard(uid).get_updates(uid)
+
+    def get_archived_updates(self, uid):
+        return self.shard(uid).get_archived_updates(uid)
+
+    def archive_updates(self, keep_last=None, older_than_days=None, encoding='binary'):
+        return sum(self._fan_out(lambda shard: shard.archive_updates(keep_last, older_than_days, encoding)))
+
+    def pack_archived_updates(self, encoding='binary'):
+        results = self._fan_out(lambda shard: shard.pack_archived_updates(encoding))
+        return tuple(sum(values) for values in zip(*results))
+
+    # Pricing
+
+    def revalue(self, chunk_size=50000, progress=None):
+        # Shards revalue in parallel; progress reports the totals over all of them
+        states = {}
+        progress_lock = threading.Lock()
+
+        def revalue_shard(index):
+            def report(scanned, total, changed):
+                with progress_lock:
+                    states[index] = (scanned, total, changed)
+                    progress(*(sum(values) for values in zip(*states.values())))
+            return self.shards[index].revalue(chunk_size, report if progress is not None else None)
+
+        return sum(self._executor.map(revalue_shard, range(self.shard_count)))
+
+    # Idempotency keys
+
+    def get_idempotent_result(self, key):
+        return self.shard(key).get_idempotent_result(key)
+
+    def reserve_idempotency_key(self, key, action, ttl):
+        return self.shard(key).reserve_idempotency_key(key, action, ttl)
+
+    def release_idempotency_key(self, key):
+        self.shard(key).release_idempotency_key(key)
+
+    def save_idempotent_result(self, key, action, result, ttl):
+        self.shard(key).save_idempotent_result(key, action, result, ttl)
+
+    def purge_idempotency_keys(self):
+        return sum(self._fan_out(lambda shard: shard.purge_idempotency_keys()))
+
+    # Maintenance
+
+    def data_version(self):
+        return tuple(shard.data_version() for shard in self.shards)
+
+    def compact(self, free_ratio=0.0):
+        return any(self._fan_out(lambda shard: shard.compact(free_ratio)))
+
+    def cache_stats(self):
+        stats = [shard.cache_stats() for shard in self.shards]
+        merged = {field: sum(entry[field] for entry in stats)
+                  for field in ('size', 'maxsize', 'hits', 'misses', 'evictions', 'expirations')}
+        lookups = merged['hits'] + merged['misses']
+        merged['hit_ratio'] = merged['hits'] / lookups if lookups else 0.0
+        return merged
+
+    def import_database(self, source_path):
+        """
+        Copy a single-file database into the shards, e.g. when switching to sharded mode.
+
+        The shards must be empty. The source is brought up to the current
+        schema first, then each shard copies its share of every table.
+
+        Returns:
+            list: Number of users copied into each shard.
+        """
+        if not os.path.exists(source_path):
+            raise ValueError(f'{source_path} does not exist.')
+        if any(shard.get_all_users() for shard in self.shards):
+            raise ValueError('The shards already hold users; import into an empty shard directory.')
+        source = sqlite3.connect(source_path)
+        try:
+            migrations.migrate(source)
+        finally:
+            source.close()
+
+        def copy_into(index):
+            shard = self.shards[index]
+            with shard.lock:
+                connection = shard.connection
+                connection.create_function('shard_index', 1, lambda key: shard_index(key, self.shard_count),
+                                           deterministic=True)
+                connection.execute('ATTACH DATABASE ? AS source', (source_path,))
+                try:
+                    for table, columns in IMPORT_TABLES.items():
+                        connection.execute(f'''
+                            INSERT INTO {table} ({columns}) SELECT {columns} FROM source.{table}
+                            WHERE shard_index(uid) = ?
+                        ''', (index,))
+                    connection.execute('''
+                        INSERT INTO idempotency_keys (key, action, result, created_at, expires_at)
+                        SELECT key, action, result, created_at, expires_at FROM source.idempotency_keys
+                        WHERE shard_index(key) = ?
+                    ''', (index,))
+                    connection.commit()
+                except sqlite3.Error:
+                    connection.rollback()
+                    raise
+                finally:
+                    connection.execute('DETACH DATABASE source')
+                    shard._invalidate()
+                    shard.user_cache.clear()
+            return len(shard.get_all_users())
+
+        return list(self._executor.map(copy_into, range(self.shard_count)))
+
+    def close(self):
+        self._executor.shutdown()
+        for shard in self.shards:
+            shard.close()
+
+def open_repository(config=None, **overrides):
+    """
+    Open the storage selected in the `database` config section: sharded
+    when `shards` is above 1, otherwise the single db/users.db.
+    """
+    config = load_config() if config is None else config
+    if config.get('database', {}).get('shards', 1) > 1:
+        return ShardedRepository.from_config(config, **overrides)
+    cache_config = config.get('cache', {})
+    settings = {
+        'cache_size': cache_config.get('size', 1024),
+        'cache_ttl': cache_config.get('ttl', 300),
+        'negative_cache_ttl': cache_config.get('negative_ttl', 30),
+        'pricing': PricingEngine.from_config(config),
+        'read_pool_size': config.get('database', {}).get('read_pool_size', 4),
+    }
+    settings.update(overrides)
+    return db_con.DBWrapper(**settings)
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command not in ('status', 'import', 'recover'):
+        print(__doc__)
+        sys.exit(1)
+    config = load_config()
+    if config.get('database', {}).get('shards', 1) < 2:
+        print("Sharding is off; set database.shards in conf/config.yaml to 2 or more.")
+        sys.exit(1)
+    repository = ShardedRepository.from_config(config, read_pool_size=1)
+    try:
+        if command == 'status':
+            for index, shard in enumerate(repository.shards):
+                print(f"shard {index}: {len(shard.get_all_users())} users  ({shard.db_path})")
+            for transfer_id, sender_uid, recipient_uid, amount in repository.open_transfers():
+                print(f"open transfer {transfer_id}: {sender_uid} -> {recipient_uid}, {amount}")
+        elif command == 'import':
+            counts = repository.import_database(sys.argv[2] if len(sys.argv) > 2 else 'db/users.db')
+            print(f"Imported {sum(counts)} users: {counts}")
+        else:
+            print(f"Completed {repository.recover(idle_seconds=0)} interrupted transfers")
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        repository.close()
@@ -0,0 +1,125 @@
+# snapshot.py
+
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+from fuzzywuzzy import fuzz
+
+# Columns shown in the admin user table, in order
+COLUMNS = ['UID', 'Name', 'Phone Hash', 'Email Hash', 'Amount Invested',
+           'Date of Investment', 'Resale Value', 'Certificate Type', 'Version']
+
+SORT_COLUMNS = {
+    'Amount Invested': 'amounts',
+    'Resale Value': 'resale_values',
+    'Date of Investment': 'dates',
+    'Name': 'name_codes',
+}
+
+class UsersSnapshot:
+    """
+    Read-only columnar copy of the users table.
+
+    Built once per data version and shared by every admin session. Numbers
+    are numpy arrays; names and certificate types are stored as codes into
+    sorted category lists, so fuzzy matching runs once per distinct value
+    and is then broadcast to all rows. Filters and sorts return row indices
+    and never copy the columns.
+    """
+
+    __slots__ = ('version', 'size', 'uids', 'phone_hashes', 'email_hashes', 'amounts',
+                 'amount_text', 'dates', 'resale_values', 'versions',
+                 'name_codes', 'name_categories', 'cert_codes', 'cert_categories')
+
+    def __init__(self, users, version=None):
+        self.version = version
+        self.size = len(users)
+        self.uids = np.array([user.uid for user in users], dtype=object)
+        self.phone_hashes = np.array([user.phone_hash for user in users], dtype=object)
+        self.email_hashes = np.array([user.email_hash for user in users], dtype=object)
+        self.amounts = np.array([user.amount_invested for user in users], dtype=np.int64)
+        self.amount_text = self.amounts.astype(str)
+        self.dates = np.array([user.date_of_investment for user in users], dtype=str)
+        self.resale_values = np.array([user.resale_value or 0 for user in users], dtype=np.float64)
+        self.versions = np.array([user.version for user in users], dtype=np.int64)
+        self.name_categories, self.name_codes = self._categorize([user.name for user in users])
+        self.cert_categories, self.cert_codes = self._categorize([user.certificate_type or '' for user in users])
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+
+    @staticmethod
+    def _categorize(values):
+        if not values:
+            return np.array([], dtype=object), np.array([], dtype=np.int32)
+        categories, codes = np.unique(np.array(values, dtype=object), return_inverse=True)
+        return categories, codes.astype(np.int32)
+
+    @staticmethod
+    def _fuzzy_mask(categories, codes, term, threshold):
+        term = term.lower()
+        matches = np.fromiter(
+            (fuzz.partial_ratio(str(category).lower(), term) > threshold for category in categories),
+            dtype=bool, count=len(categories)
+        )
+        return matches[codes]
+
+    def filter(self, name='', amount='', date='', certificate_type='', threshold=75):
+        """
+        Rows matching every given filter. Name and certificate type match fuzzily,
+        amount and date by substring.
+
+        Returns:
+            numpy.ndarray: Indices of the matching rows.
+        """
+        mask = np.ones(self.size, dtype=bool)
+        if name:
+            mask &= self._fuzzy_mask(self.name_categories, self.name_codes, name, threshold)
+        if certificate_type:
+            mask &= self._fuzzy_mask(self.cert_categories, self.cert_codes, certificate_type, threshold)
+        if amount:
+            mask &= np.char.find(self.amount_text, amount.strip()) >= 0
+        if date:
+            mask &= np.char.find(self.dates, date.strip()) >= 0
+        return np.flatnonzero(mask)
+
+    def sort(self, indices, column, descending=False):
+        """Reorder `indices` by one of SORT_COLUMNS"""
+        keys = getattr(self, SORT_COLUMNS[column])[indices]
+        order = np.argsort(keys, kind='stable')
+        if descending:
+            order = order[::-1]
+        return indices[order]
+
+    def to_frame(self, indices):
+        """DataFrame of just the given rows, for display"""
+        return pd.DataFrame({
+            'UID': self.uids[indices],
+            'Name': self.name_categories[self.name_codes[indices]],
+            'Phone Hash': self.phone_hashes[indices],
+            'Email Hash': self.email_hashes[indices],
+            'Amount Invested': self.amounts[indices],
+            'Date of Investment': self.dates[indices],
+            'Resale Value': self.resale_values[indices],
+            'Certificate Type': pd.Categorical.from_codes(self.cert_codes[indices], self.cert_categories),
+            'Version': self.versions[indices],
+        }, columns=COLUMNS)
+
+_snapshots = weakref.WeakKeyDictionary()
+_snapshots_lock = threading.Lock()
+
+def get_snapshot(repository):
+    """
+    Return the shared snapshot of `repository`, rebuilding it only when the
+    repository's data version has changed.
+    """
+    version = repository.data_version()
+    with _snapshots_lock:
+        snapshot = _snapshots.get(repository)
+        if snapshot is None or version is None or snapshot.version != version:
+            snapshot = UsersSnapshot(repository.get_all_users(), version)
+            _snapshots[repository] = snapshot
+        return snapshot
@@ -22,7 +22,7 @@ class UIDGen:
     def _load_existing_uids(self):
         """Load all existing UIDs from database into cache"""
         users = self.db_wrapper.get_all_users()
-        self._used_uids = {user[0] for user in users}
+        self._used_uids = {user.uid for user in users}
 
     def uid_exists(self, uid):
         """Check if UID exists in cache or database"""